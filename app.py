@@ -1,187 +1,293 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
-import xml.etree.ElementTree as ET
 from datetime import datetime
-import io
-import zipfile
-from openpyxl.styles import Font, PatternFill, Alignment
+import logging
+import math
+import os
+from functools import partial
+from cache import CacheLRU, calcular_digest
+from concurrent.futures.process import BrokenProcessPool
+from exportacao import cols_to_format_currency, formatos_excel, gerar_excel, preparar_tabela
+from extracao import criar_pool
+from formatacao import format_centavos, format_cpf_cnpj
+from indice import IndiceNotas
+from relatorio import relatorio_html
+from resumos import DIMENSOES_RESUMO, TOTAIS_RESUMO, agrupar_por_prestador, montar_cubo, resumir, rotulo_mes, valores_dimensao
+from tabela import formatar_pagina, formatar_resumo, formatos_resumo, posicoes_tabela, tabela_resumo
+from tarefas import TarefaExtracao
 
-def extrair_dados_nfse(xml_file):
-    
-    all_dados = []
-    emitente_info = None
-
-    if xml_file.name.endswith('.zip'):
-        with zipfile.ZipFile(xml_file, 'r') as zip_ref:
-            for xml_filename in zip_ref.namelist():
-                if xml_filename.endswith('.xml'):
-                    with zip_ref.open(xml_filename) as single_xml_file:
-                        dados, emitente = processar_xml(io.BytesIO(single_xml_file.read()))
-                        all_dados.extend(dados)
-                        if emitente and not emitente_info:
-                            emitente_info = emitente
-    elif xml_file.name.endswith('.xml'):
-        dados, emitente = processar_xml(xml_file)
-        all_dados.extend(dados)
-        emitente_info = emitente
-
-    return pd.DataFrame(all_dados), emitente_info
-
-def processar_xml(xml_content):
-    try:
-        tree = ET.parse(xml_content)
-        root = tree.getroot()
-    except ET.ParseError:
-        return [], None # Retorna lista vazia se o XML for inválido
-
-    ns = {'ns': 'http://www.abrasf.org.br/nfse.xsd'}
-    
-    dados = []
-    emitente_info = None
-    
-    for nfse in root.findall('.//ns:InfNfse', ns):
-        
-        # Extrair dados do Emitente (Prestador) apenas uma vez
-        if not emitente_info:
-            cnpj_prestador_element = nfse.find('.//ns:Prestador/ns:CpfCnpj/ns:Cnpj', ns)
-            cnpj_prestador = cnpj_prestador_element.text if cnpj_prestador_element is not None else 'N/A'
-            
-            razao_social_prestador_element = nfse.find('.//ns:Prestador/ns:RazaoSocial', ns)
-            razao_social_prestador = razao_social_prestador_element.text if razao_social_prestador_element is not None else 'N/A'
-            
-            emitente_info = {
-                'cnpj': cnpj_prestador,
-                'razao_social': razao_social_prestador
-            }
-        
-        # Dados do Tomador (CPF ou CNPJ)
-        cpf_cnpj_tomador_element = nfse.find('.//ns:IdentificacaoTomador/ns:CpfCnpj', ns)
-        if cpf_cnpj_tomador_element is not None:
-            cpf_tomador = cpf_cnpj_tomador_element.find('.//ns:Cpf', ns)
-            cnpj_tomador = cpf_cnpj_tomador_element.find('.//ns:Cnpj', ns)
-            cpf_cnpj_valor = cpf_tomador.text if cpf_tomador is not None else cnpj_tomador.text if cnpj_tomador is not None else 'N/A'
-        else:
-            cpf_cnpj_valor = 'N/A'
-
-        razao_social_tomador_element = nfse.find('.//ns:Tomador/ns:RazaoSocial', ns)
-        razao_social_tomador = razao_social_tomador_element.text if razao_social_tomador_element is not None else 'N/A'
-        
-        # Dados da NFS-e
-        numero_nfse_element = nfse.find('.//ns:Numero', ns)
-        numero_nfse = numero_nfse_element.text if numero_nfse_element is not None else 'N/A'
-        
-        valor_servicos_element = nfse.find('.//ns:Servico/ns:Valores/ns:ValorServicos', ns)
-        valor_servicos = valor_servicos_element.text if valor_servicos_element is not None else '0'
-        
-        valor_iss_element = nfse.find('.//ns:ValoresNfse/ns:ValorIss', ns)
-        valor_iss = valor_iss_element.text if valor_iss_element is not None else 'N/A'
-        
-        iss_retido_element = nfse.find('.//ns:Servico/ns:IssRetido', ns)
-        iss_retido = iss_retido_element.text if iss_retido_element is not None else '2'
-        iss_retido_texto = "Sim" if iss_retido == "1" else "Não"
-        
-        data_emissao_element = nfse.find('.//ns:DataEmissao', ns)
-        if data_emissao_element is not None and data_emissao_element.text:
-            try:
-                data_emissao = datetime.fromisoformat(data_emissao_element.text).strftime('%d/%m/%Y')
-            except:
-                data_emissao = 'N/A'
-        else:
-            data_emissao = 'N/A'
-        
-        item_lista_servico_element = nfse.find('.//ns:Servico/ns:ItemListaServico', ns)
-        item_lista_servico = item_lista_servico_element.text if item_lista_servico_element is not None else 'N/A'
-        
-        codigo_nbs_element = nfse.find('.//ns:Servico/ns:CodigoNbs', ns)
-        codigo_nbs = codigo_nbs_element.text if codigo_nbs_element is not None else 'N/A'
-        
-        codigo_cnae_element = nfse.find('.//ns:Servico/ns:CodigoCnae', ns)
-        codigo_cnae = codigo_cnae_element.text if codigo_cnae_element is not None else 'N/A'
-        
-        # Base de Cálculo IBSCBS
-        vBC_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:vBC', ns)
-        vBC = vBC_element.text if vBC_element is not None else '0'
-        
-        # Dados IBSCBS - tratando elementos que podem não existir
-        pIBSUF_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:uf/ns:pIBSUF', ns)
-        pIBSUF = pIBSUF_element.text if pIBSUF_element is not None else '0'
-        
-        pRedAliqUF_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:uf/ns:pRedAliqUF', ns)
-        pRedAliqUF = pRedAliqUF_element.text if pRedAliqUF_element is not None else '0'
-        
-        pAliqEfetUF_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:uf/ns:pAliqEfetUF', ns)
-        pAliqEfetUF = pAliqEfetUF_element.text if pAliqEfetUF_element is not None else '0'
-        
-        pRedAliqMun_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:mun/ns:pRedAliqMun', ns)
-        pRedAliqMun = pRedAliqMun_element.text if pRedAliqMun_element is not None else '0'
-        
-        pCBS_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:fed/ns:pCBS', ns)
-        pCBS = pCBS_element.text if pCBS_element is not None else '0'
-        
-        pRedAliqCBS_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:fed/ns:pRedAliqCBS', ns)
-        pRedAliqCBS = pRedAliqCBS_element.text if pRedAliqCBS_element is not None else '0'
-        
-        pAliqEfetCBS_element = nfse.find('.//ns:IBSCBS/ns:valores/ns:fed/ns:pAliqEfetCBS', ns)
-        pAliqEfetCBS = pAliqEfetCBS_element.text if pAliqEfetCBS_element is not None else '0'
-        
-        vIBSUF_element = nfse.find('.//ns:IBSCBS/ns:totCIBS/ns:gIBS/ns:gIBSUFTot/ns:vIBSUF', ns)
-        vIBSUF = vIBSUF_element.text if vIBSUF_element is not None else '0'
-        
-        vCBS_element = nfse.find('.//ns:IBSCBS/ns:totCIBS/ns:gCBS/ns:vCBS', ns)
-        vCBS = vCBS_element.text if vCBS_element is not None else '0'
-        
-        # Descrição do Serviço
-        discriminacao_element = nfse.find('.//ns:Servico/ns:Discriminacao', ns)
-        discriminacao = discriminacao_element.text if discriminacao_element is not None else 'N/A'
-        
-        dados.append({
-            "CPF/CNPJ Tomador": cpf_cnpj_valor,
-            "Razão Social Tomador": razao_social_tomador,
-            "Número NFS-e": numero_nfse,
-            "Valor do Serviço": float(valor_servicos),
-            "Alíquota": "3%",
-            "ISS": float(valor_iss) if valor_iss != 'N/A' else 0,
-            "ISS Retido": iss_retido_texto,
-            "Data de Emissão": data_emissao,
-            "Item": item_lista_servico,
-            "Código NBS": codigo_nbs,
-            "Código CNAE": codigo_cnae,
-            "Base de Cálculo IBSCBS": float(vBC),
-            "pIBSUF": float(pIBSUF),
-            "pRedAliqUF": float(pRedAliqUF),
-            "pAliqEfetUF": float(pAliqEfetUF),
-            "pRedAliqMun": float(pRedAliqMun),
-            "pCBS": float(pCBS),
-            "pRedAliqCBS": float(pRedAliqCBS),
-            "pAliqEfetCBS": float(pAliqEfetCBS),
-            "vIBSUF": float(vIBSUF),
-            "vCBS": float(vCBS),
-            "Descrição do Serviço": discriminacao
-        })
-        
-    return dados, emitente_info
-
-def format_cpf_cnpj(value):
-    if value == 'N/A' or value is None:
-        return 'N/A'
-    
-    cleaned_value = ''.join(filter(str.isdigit, str(value)))
-    
-    if len(cleaned_value) == 11:
-        return f'{cleaned_value[:3]}.{cleaned_value[3:6]}.{cleaned_value[6:9]}-{cleaned_value[9:]}'
-    elif len(cleaned_value) == 14:
-        return f'{cleaned_value[:2]}.{cleaned_value[2:5]}.{cleaned_value[5:8]}/{cleaned_value[8:12]}-{cleaned_value[12:]}'
+TAMANHOS_PAGINA = [50, 100, 500, 1000]
+
+# Acima disso o relatório completo só é oferecido para download, não no iframe
+LIMITE_IMPRESSAO_DIRETA = 2000
+
+def obter_excel(cache, chave, cnpj, df):
+    # Chamado pelo botão de download apenas quando a planilha é pedida
+    return cache.obter_ou_calcular(('excel', chave, cnpj), lambda: gerar_excel(df, formatos_excel, cols_to_format_currency))
+
+def obter_relatorio(cache, chave, cnpj, emitente, totais, df, somente_resumo):
+    # Relatório HTML (bytes) montado uma vez por upload, prestador e modo
+    return cache.obter_ou_calcular(
+        ('html', chave, cnpj, somente_resumo),
+        lambda: relatorio_html(emitente, totais, df, somente_resumo)
+    )
+
+@st.cache_resource
+def obter_cache():
+    # Cache único do processo: resultados por digest do upload e de cada XML do ZIP
+    return CacheLRU(max_bytes=512 * 1024 * 1024)
+
+def obter_cache_sessao():
+    # Cache só desta sessão, para o resultado de uma extração com o índice
+    # local e o que é derivado dele: o mesmo upload dá notas diferentes
+    # conforme o que já foi registrado no índice, então nada disso pode ir
+    # para o cache do processo, compartilhado entre as sessões
+    if 'cache_sessao' not in st.session_state:
+        st.session_state['cache_sessao'] = CacheLRU(max_bytes=128 * 1024 * 1024)
+    return st.session_state['cache_sessao']
+
+@st.cache_resource
+def obter_indice():
+    # Índice local (SQLite) de arquivos e notas já processados
+    return IndiceNotas(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indice_nfse.sqlite3'))
+
+@st.cache_resource
+def obter_pool(workers):
+    # Pool de processos do servidor para cada número de processos, reaproveitado
+    # por todas as extrações paralelas: cada processo (Python + pandas) é
+    # iniciado uma vez, não a cada upload
+    return criar_pool(workers)
+
+@st.cache_resource
+def configurar_log():
+    # Métricas da extração como linhas JSON no log do servidor (uma vez por processo)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('nfse')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+def obter_tarefa(chave, iniciar):
+    # Extração em segundo plano da sessão para o upload `chave`; a de um
+    # upload anterior é cancelada e iniciar() cria a do upload atual. O cache
+    # da sessão (obter_cache_sessao) só vale para a extração atual.
+    extracao = st.session_state.get('extracao')
+    if extracao is None or extracao[0] != chave:
+        if extracao is not None:
+            extracao[1].cancelar()
+        st.session_state.pop('cache_sessao', None)
+        extracao = st.session_state['extracao'] = (chave, iniciar())
+    return extracao[1]
+
+def exibir_totais_prestadores(totais):
+    # Tabela com os totais de cada prestador (linhas de agrupar_por_prestador)
+    st.dataframe(
+        totais.rename(columns={'razao_social': 'Razão Social', 'notas': 'Notas', **TOTAIS_RESUMO})
+              .rename_axis('CNPJ Prestador').reset_index()
+              .style.format({'CNPJ Prestador': format_cpf_cnpj, **{rotulo: format_centavos for rotulo in TOTAIS_RESUMO.values()}}),
+        hide_index=True
+    )
+
+def exibir_parciais(andamento):
+    # Totais por prestador e últimas notas lidas até agora (antes do índice local)
+    if andamento['totais'] is None:
+        return
+    st.subheader("⏳ Resultados parciais")
+    exibir_totais_prestadores(andamento['totais'])
+    st.caption(f"Últimas {len(andamento['linhas'])} notas lidas")
+    st.dataframe(formatar_pagina(preparar_tabela(andamento['linhas'])), hide_index=True)
+
+@st.fragment(run_every=1)
+def acompanhar_extracao(tarefa):
+    # Só este trecho é atualizado a cada segundo enquanto a extração roda;
+    # quando ela termina, o app inteiro roda de novo para exibir o resultado
+    andamento = tarefa.andamento()
+    if andamento['status'] != 'executando':
+        st.rerun()
+
+    if andamento['total'] is None:
+        st.progress(0.0, text="Abrindo os arquivos...")
     else:
-        return value
+        st.progress(
+            andamento['concluidos'] / max(andamento['total'], 1),
+            text=f"{andamento['concluidos']} de {andamento['total']} arquivos XML · {andamento['notas']} notas · "
+                 f"{andamento['notas_por_segundo']:.0f} notas/s"
+        )
+    cancelar = st.button("⏹️ Cancelar extração", key="cancelar_extracao", disabled=andamento['cancelando'])
+    if cancelar:
+        tarefa.cancelar()
+    if cancelar or andamento['cancelando']:
+        st.info("Cancelando a extração...")
+
+    exibir_parciais(andamento)
+
+def exibir_extracao_interrompida(tarefa):
+    # Extração cancelada ou com erro: resultados parciais e a opção de recomeçar
+    andamento = tarefa.andamento()
+    if andamento['status'] == 'erro':
+        st.error(f"A extração falhou: {tarefa.erro}")
+    else:
+        st.warning(
+            f"Extração cancelada após {andamento['concluidos']} de {andamento['total'] or 0} arquivos XML "
+            f"({andamento['notas']} notas em {andamento['segundos']:.1f} s)."
+        )
+    if st.button("🔄 Extrair novamente", key="reiniciar_extracao"):
+        del st.session_state['extracao']
+        st.rerun()
+    exibir_parciais(andamento)
+
+def exibir_metricas(metricas):
+    # Painel lateral: etapas da extração, arquivos mais lentos e arquivos com erro
+    resumo = metricas.resumo()
+    with st.sidebar.expander("📈 Métricas da extração"):
+        st.caption(
+            f"{resumo['arquivos']} arquivos ({resumo['bytes'] / 1e6:.1f} MB), {resumo['notas']} notas "
+            f"em {resumo['segundos']:.2f} s; {resumo['arquivos_em_cache']} vindos do cache"
+        )
+        st.dataframe(pd.DataFrame.from_dict(metricas.etapas, orient='index'), use_container_width=True)
+        if metricas.arquivos:
+            st.markdown("**Arquivos mais lentos**")
+            lentos = sorted(metricas.arquivos, key=lambda arquivo: arquivo['segundos'], reverse=True)[:10]
+            colunas = ['arquivo', 'bytes', 'notas', 'segundos'] + (['pico_mb'] if metricas.medir_memoria else [])
+            st.dataframe(pd.DataFrame(lentos, columns=colunas), hide_index=True, use_container_width=True)
+        if metricas.erros:
+            st.markdown(f"**Arquivos com erro ({len(metricas.erros)})**")
+            st.dataframe(pd.DataFrame(metricas.erros, columns=['arquivo', 'erro']), hide_index=True, use_container_width=True)
+
+def rotulo_valor(dimensao, valor):
+    # Texto de um valor de dimensão nos filtros dos resumos
+    if dimensao == "Mês":
+        return rotulo_mes(valor)
+    if dimensao == "CPF/CNPJ Tomador":
+        return format_cpf_cnpj(valor)
+    return str(valor)
+
+def exibir_resumos(cache, chave, cnpj, df, sufixo=''):
+    # Resumos por tomador, CNAE, NBS, item e competência. O cubo de agregados
+    # é montado uma vez por upload e prestador; trocar o agrupamento ou os
+    # filtros só reagrupa o cubo.
+    cubo = cache.obter_ou_calcular(('cubo', chave, cnpj), lambda: montar_cubo(df))
+
+    col_dimensao, col_filtro, col_valores = st.columns([1, 1, 2])
+    with col_dimensao:
+        dimensao = st.selectbox("Agrupar por", list(DIMENSOES_RESUMO), format_func=DIMENSOES_RESUMO.get, key=f"dimensao_{cnpj}")
+    with col_filtro:
+        filtro = st.selectbox(
+            "Filtrar por", [None] + [coluna for coluna in DIMENSOES_RESUMO if coluna != dimensao],
+            format_func=lambda coluna: DIMENSOES_RESUMO[coluna] if coluna else "Sem filtro", key=f"filtro_{cnpj}"
+        )
+    with col_valores:
+        valores = st.multiselect(
+            "Valores", valores_dimensao(cubo, filtro) if filtro else [],
+            format_func=lambda valor: rotulo_valor(filtro, valor), disabled=filtro is None, key=f"valores_{cnpj}_{filtro}"
+        )
+
+    tabela = tabela_resumo(cache.obter_ou_calcular(
+        ('resumo', chave, cnpj, dimensao, filtro, tuple(valores)),
+        lambda: resumir(cubo, dimensao, {filtro: valores} if filtro else None)
+    ))
+    st.dataframe(formatar_resumo(tabela), hide_index=True)
+    st.download_button(
+        label="Baixar resumo em Excel",
+        data=partial(gerar_excel, tabela, formatos_resumo(tabela), list(TOTAIS_RESUMO.values())),
+        file_name=f"resumo_nfse{sufixo}_{DIMENSOES_RESUMO[dimensao].lower().replace(' ', '_')}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key=f"excel_resumo_{cnpj}"
+    )
+
+def exibir_prestador(cache, chave, cnpj, totais, df, sufixo=''):
+    # Resumo, impressão, tabela e planilha das notas de um prestador; totais é
+    # a linha do prestador em resumos.agrupar_por_prestador
+    emitente = {'cnpj': cnpj, 'razao_social': totais['razao_social']}
 
-def format_brazilian_currency(value):
-    try:
-        float_value = float(value)
-        # Formata para o padrão brasileiro: R$ 1.234,56
-        return f'R$ {float_value:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
-    except (ValueError, TypeError):
-        return f'R$ 0,00'
+    # Exibir dados do emitente
+    st.markdown(f"### 🏢 {emitente['razao_social']}")
+    st.markdown(f"**CNPJ:** {format_cpf_cnpj(emitente['cnpj'])}")
+    st.divider()
+
+    # Quadro de Resumo
+    st.subheader("📊 Resumo dos Valores")
+
+    for coluna_st, (coluna, rotulo) in zip(st.columns(len(TOTAIS_RESUMO)), TOTAIS_RESUMO.items()):
+        with coluna_st:
+            st.metric(label=rotulo, value=format_centavos(totais[coluna]))
+
+    # Relatório de impressão: completo (notas em páginas) ou só com os totais
+    somente_resumo = st.toggle("Relatório somente com o resumo", key=f"resumo_{cnpj}")
+
+    # Botão de Impressão
+    if st.button("🖨️ Imprimir Relatório", use_container_width=True, key=f"imprimir_{cnpj}"):
+        if somente_resumo or len(df) <= LIMITE_IMPRESSAO_DIRETA:
+            # Exibe o HTML em uma nova janela que abrirá automaticamente o diálogo de impressão
+            html_content = obter_relatorio(cache, chave, cnpj, emitente, totais, df, somente_resumo)
+            components.html(html_content.decode('utf-8'), height=0, scrolling=False)
+        else:
+            st.info(
+                f"O relatório completo tem {len(df)} notas e é grande demais para abrir direto no navegador. "
+                "Baixe o HTML abaixo (ele abre o diálogo de impressão) ou use o relatório somente com o resumo."
+            )
+
+        # Opção adicional para baixar o HTML caso queira guardar (gerado só quando pedido)
+        st.download_button(
+            label="📥 Ou baixar o relatório em HTML",
+            data=partial(obter_relatorio, cache, chave, cnpj, emitente, totais, df, somente_resumo),
+            file_name=f"relatorio_nfse{sufixo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html",
+            mime="text/html",
+            use_container_width=True,
+            key=f"html_{cnpj}"
+        )
+
+    st.divider()
+
+    with st.expander("📑 Resumos por tomador, CNAE, NBS, item e competência"):
+        exibir_resumos(cache, chave, cnpj, df, sufixo)
+
+    # Tabela e planilha também ficam no cache, ligadas aos digests do upload
+    df = cache.obter_ou_calcular(('tabela', chave, cnpj), lambda: preparar_tabela(df))
+
+    # Busca, ordenação e paginação no servidor, sobre as colunas tipadas;
+    # só as linhas da página exibida passam pela formatação
+    col_busca, col_ordem, col_sentido, col_tamanho, col_pagina = st.columns([3, 2, 1, 1, 1])
+    with col_busca:
+        busca = st.text_input("Buscar", key=f"busca_{cnpj}", placeholder="Tomador, número, item, descrição...")
+    with col_ordem:
+        ordenar_por = st.selectbox("Ordenar por", [None] + list(df.columns), format_func=lambda col: col or "Ordem original", key=f"ordem_{cnpj}")
+    with col_sentido:
+        crescente = st.selectbox("Sentido", [True, False], format_func=lambda c: "Crescente" if c else "Decrescente", key=f"sentido_{cnpj}")
+    with col_tamanho:
+        tamanho_pagina = st.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1, key=f"tamanho_{cnpj}")
+
+    posicoes = cache.obter_ou_calcular(
+        ('posicoes', chave, cnpj, busca, ordenar_por, crescente),
+        lambda: posicoes_tabela(df, busca, ordenar_por, crescente)
+    )
+    total_paginas = max(1, math.ceil(len(posicoes) / tamanho_pagina))
+    # Se a busca ou o tamanho da página mudou, a página anterior pode não existir mais
+    chave_pagina = f"pagina_{cnpj}"
+    st.session_state[chave_pagina] = min(st.session_state.get(chave_pagina, 1), total_paginas)
+    with col_pagina:
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, key=chave_pagina)
+    inicio = (pagina - 1) * tamanho_pagina
+    st.caption(f"{len(posicoes)} de {len(df)} notas · página {pagina} de {total_paginas}")
+
+    # Estilizando a página (já formatada coluna a coluna)
+    st.dataframe(formatar_pagina(df.iloc[posicoes[inicio:inicio + tamanho_pagina]]).style
+                       .set_properties(**{'text-align': 'center'})
+                       .set_table_styles([
+                           {'selector': 'thead th', 'props': [('background-color', '#1f77b4'), ('color', 'white'), ('text-align', 'center'), ('font-weight', 'bold')]},
+                           {'selector': 'tbody tr', 'props': [('text-align', 'center')]}
+                       ]))
+
+    # Download Excel (gerado só quando o botão é clicado)
+    st.download_button(
+        label="Baixar Planilha Excel",
+        data=partial(obter_excel, cache, chave, cnpj, df),
+        file_name=f"dados_nfse{sufixo}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key=f"excel_{cnpj}"
+    )
 
 st.set_page_config(layout="wide", initial_sidebar_state="expanded")
 
@@ -258,260 +364,89 @@ st.markdown(dark_theme_css, unsafe_allow_html=True)
 
 st.title("Relatório  NFS-e")
 
-uploaded_file = st.file_uploader("Escolha um arquivo XML ou ZIP de NFS-e", type=["xml", "zip"])
+uploaded_files = st.file_uploader("Escolha arquivos XML ou ZIP de NFS-e", type=["xml", "zip"], accept_multiple_files=True)
 
-if uploaded_file is not None:
-    df, emitente = extrair_dados_nfse(uploaded_file)
-    
-    if not df.empty:
-        # Exibir dados do emitente
-        if emitente:
-            st.markdown(f"### 🏢 {emitente['razao_social']}")
-            st.markdown(f"**CNPJ:** {format_cpf_cnpj(emitente['cnpj'])}")
-            st.divider()
-        
-        # Quadro de Resumo
-        st.subheader("📊 Resumo dos Valores")
-        
-        total_ibs = df['vIBSUF'].sum()
-        total_cbs = df['vCBS'].sum()
-        total_servicos = df['Valor do Serviço'].sum()
-        total_iss = df['ISS'].sum()
-        
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric(label="Total IBS (UF)", value=format_brazilian_currency(total_ibs))
-        
-        with col2:
-            st.metric(label="Total CBS", value=format_brazilian_currency(total_cbs))
-        
-        with col3:
-            st.metric(label="Total de Serviços", value=format_brazilian_currency(total_servicos))
-        
-        with col4:
-            st.metric(label="Total ISS", value=format_brazilian_currency(total_iss))
-        
-        # Botão de Impressão
-        if st.button("🖨️ Imprimir Relatório", use_container_width=True):
-            # Gera HTML para impressão com script que abre janela de impressão automaticamente
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>Relatório NFS-e - {emitente['razao_social'] if emitente else 'Relatório'}</title>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        margin: 20px;
-                    }}
-                    h1 {{
-                        color: #1f77b4;
-                        text-align: center;
-                    }}
-                    h2 {{
-                        color: #333;
-                        margin-top: 10px;
-                    }}
-                    .emitente {{
-                        background-color: #f0f0f0;
-                        padding: 15px;
-                        margin-bottom: 20px;
-                        border-radius: 5px;
-                    }}
-                    .resumo {{
-                        display: grid;
-                        grid-template-columns: repeat(4, 1fr);
-                        gap: 15px;
-                        margin-bottom: 30px;
-                    }}
-                    .metric {{
-                        background-color: #e8f4f8;
-                        padding: 15px;
-                        border-radius: 5px;
-                        text-align: center;
-                        border-left: 4px solid #1f77b4;
-                    }}
-                    .metric-label {{
-                        font-size: 12px;
-                        color: #666;
-                        margin-bottom: 5px;
-                    }}
-                    .metric-value {{
-                        font-size: 20px;
-                        font-weight: bold;
-                        color: #1f77b4;
-                    }}
-                    table {{
-                        width: 100%;
-                        border-collapse: collapse;
-                        margin-top: 20px;
-                        font-size: 10px;
-                    }}
-                    th {{
-                        background-color: #1f77b4;
-                        color: white;
-                        padding: 8px;
-                        text-align: center;
-                        border: 1px solid #ddd;
-                    }}
-                    td {{
-                        padding: 6px;
-                        text-align: center;
-                        border: 1px solid #ddd;
-                    }}
-                    tr:nth-child(even) {{
-                        background-color: #f9f9f9;
-                    }}
-                    @media print {{
-                        .no-print {{
-                            display: none;
-                        }}
-                    }}
-                </style>
-            </head>
-            <body>
-                <h1>Relatório de NFS-e</h1>
-                {f'<div class="emitente"><h2>Emitente</h2><p><strong>{emitente["razao_social"]}</strong></p><p>CNPJ: {format_cpf_cnpj(emitente["cnpj"])}</p></div>' if emitente else ''}
-                
-                <h2>Resumo dos Valores</h2>
-                <div class="resumo">
-                    <div class="metric">
-                        <div class="metric-label">Total IBS (UF)</div>
-                        <div class="metric-value">{format_brazilian_currency(total_ibs)}</div>
-                    </div>
-                    <div class="metric">
-                        <div class="metric-label">Total CBS</div>
-                        <div class="metric-value">{format_brazilian_currency(total_cbs)}</div>
-                    </div>
-                    <div class="metric">
-                        <div class="metric-label">Total de Serviços</div>
-                        <div class="metric-value">{format_brazilian_currency(total_servicos)}</div>
-                    </div>
-                    <div class="metric">
-                        <div class="metric-label">Total ISS</div>
-                        <div class="metric-value">{format_brazilian_currency(total_iss)}</div>
-                    </div>
-                </div>
-                
-                <h2>Detalhamento das Notas</h2>
-                {df.to_html(index=False, classes='table')}
-                
-                <script>
-                    // Abre a janela de impressão automaticamente
-                    window.onload = function() {{
-                        window.print();
-                    }}
-                </script>
-            </body>
-            </html>
-            """
-            
-            # Exibe o HTML em uma nova janela que abrirá automaticamente o diálogo de impressão
-            components.html(html_content, height=0, scrolling=False)
-            
-            # Opção adicional para baixar o HTML caso queira guardar
-            st.download_button(
-                label="📥 Ou baixar o relatório em HTML",
-                data=html_content.encode('utf-8'),
-                file_name=f"relatorio_nfse_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html",
-                mime="text/html",
-                use_container_width=True
-            )
-        
-        st.divider()
-        
-        # Excluir as colunas solicitadas
-        df = df.drop(columns=['pIBSMun', 'pAliqEfetMun', 'vIBSMun'], errors='ignore')
-        
-        if 'CPF/CNPJ Tomador' in df.columns:
-            df['CPF/CNPJ Tomador'] = df['CPF/CNPJ Tomador'].apply(format_cpf_cnpj)
-
-        # Colunas sem formatação percentual (valores numéricos simples)
-        cols_numeric = ["pIBSUF", "pRedAliqUF", "pAliqEfetUF", "pRedAliqMun", "pCBS", "pRedAliqCBS", "pAliqEfetCBS"]
-
-        cols_to_format_currency = [
-            "Valor do Serviço", "ISS", "Base de Cálculo IBSCBS",
-            "vIBSUF", "vCBS"
-        ]
-        
-        all_numeric_cols = cols_numeric + cols_to_format_currency
-        for col in all_numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-        # Estilizando o DataFrame
-        formatters = {col: '{:.2f}'.format for col in cols_numeric}
-        formatters.update({col: format_brazilian_currency for col in cols_to_format_currency})
-        
-        st.dataframe(df.style.format(formatters)
-                           .set_properties(**{'text-align': 'center'})
-                           .set_table_styles([
-                               {'selector': 'thead th', 'props': [('background-color', '#1f77b4'), ('color', 'white'), ('text-align', 'center'), ('font-weight', 'bold')]},
-                               {'selector': 'tbody tr', 'props': [('text-align', 'center')]}
-                           ]))
-        
-        # Download Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Dados NFS-e')
-            
-            # Aplica a formatação na planilha do Excel
-            workbook = writer.book
-            worksheet = writer.sheets['Dados NFS-e']
-            
-            # Formatação de moeda
-            currency_format = 'R$ #,##0.00'
-            number_format = '0.00'
-            
-            # Estilo do cabeçalho
-            header_fill = PatternFill(start_color='1F77B4', end_color='1F77B4', fill_type='solid')
-            header_font = Font(bold=True, color='FFFFFF', size=11)
-            header_alignment = Alignment(horizontal='center', vertical='center')
-            
-            # Alinhamento centralizado para células de dados
-            center_alignment = Alignment(horizontal='center', vertical='center')
-            
-            # Aplicar estilo ao cabeçalho
-            for cell in worksheet[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = header_alignment
-            
-            # Encontra as colunas para formatar e aplica o estilo
-            for col_idx, col_name in enumerate(df.columns, 1):
-                col_letter = chr(ord('A') + col_idx - 1) if col_idx <= 26 else chr(ord('A') + (col_idx - 1) // 26 - 1) + chr(ord('A') + (col_idx - 1) % 26)
-                
-                if col_name in cols_to_format_currency:
-                    for cell in worksheet[col_letter][1:]: # Pula o cabeçalho
-                        cell.number_format = currency_format
-                        cell.alignment = center_alignment
-                elif col_name in cols_numeric:
-                    for cell in worksheet[col_letter][1:]: # Pula o cabeçalho
-                        cell.number_format = number_format
-                        cell.alignment = center_alignment
-                else:
-                    for cell in worksheet[col_letter][1:]: # Pula o cabeçalho
-                        cell.alignment = center_alignment
-                
-                # Auto-ajustar largura das colunas
-                max_length = 0
-                column = worksheet[col_letter]
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)  # Limita a largura máxima em 50
-                worksheet.column_dimensions[col_letter].width = adjusted_width
+# Número de processos usados para ler os XMLs dos arquivos enviados
+workers = st.sidebar.number_input(
+    "Processos paralelos",
+    min_value=1,
+    max_value=os.cpu_count() or 1,
+    value=os.cpu_count() or 1
+)
 
-        st.download_button(
-            label="Baixar Planilha Excel",
-            data=output.getvalue(),
-            file_name="dados_nfse.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Notas repetidas nos arquivos enviados são sempre ignoradas; com o índice
+# ligado, também os arquivos e notas já extraídos em uploads anteriores
+usar_indice = st.sidebar.checkbox("Ignorar notas já processadas (índice local)", value=False)
+
+# O pico de memória por etapa usa o tracemalloc, que deixa a leitura mais lenta
+medir_memoria = st.sidebar.checkbox("Medir pico de memória (mais lento)", value=False)
+
+configurar_log()
+
+if uploaded_files:
+    # Cada rerun do Streamlit reaproveita o resultado dos mesmos uploads (mesmo
+    # conteúdo). Com o índice, o resultado fica só na tarefa desta sessão.
+    cache = obter_cache()
+    chave = (tuple(calcular_digest(arquivo.getvalue()) for arquivo in uploaded_files), usar_indice)
+    resultado = cache.obter(('upload', chave)) if not usar_indice else None
+    if resultado is None:
+        # A extração roda numa thread; enquanto isso, só o andamento é exibido
+        tarefa = obter_tarefa(chave, lambda: TarefaExtracao(
+            uploaded_files, workers, cache, obter_indice() if usar_indice else None, medir_memoria,
+            pool=obter_pool(workers) if workers > 1 else None
+        ).iniciar())
+        if tarefa.status == 'executando':
+            acompanhar_extracao(tarefa)
+            st.stop()
+        if tarefa.status != 'concluida':
+            if isinstance(tarefa.erro, BrokenProcessPool):
+                # Um processo do pool morreu (falta de memória, por exemplo): a
+                # próxima extração começa com um pool novo
+                obter_pool.clear()
+            exibir_metricas(tarefa.metricas)
+            exibir_extracao_interrompida(tarefa)
+            st.stop()
+        resultado = tarefa.resultado if usar_indice else cache.guardar(('upload', chave), tarefa.resultado)
+    df, _, metricas = resultado
+    if usar_indice:
+        # Totais, tabelas, planilhas e relatórios do resultado desta sessão
+        cache = obter_cache_sessao()
+    exibir_metricas(metricas)
+
+    if metricas.erros:
+        st.warning(
+            f"{len(metricas.erros)} arquivo(s) não puderam ser lidos e foram ignorados: "
+            + ", ".join(erro['arquivo'] for erro in metricas.erros[:5])
+            + (" ..." if len(metricas.erros) > 5 else "")
+        )
+
+    deduplicacao = df.attrs.get('deduplicacao')
+    if deduplicacao and (deduplicacao['arquivos_ignorados'] or deduplicacao['notas_ignoradas']):
+        st.info(
+            f"{deduplicacao['notas_novas']} notas novas; {deduplicacao['notas_ignoradas']} notas e "
+            f"{deduplicacao['arquivos_ignorados']} arquivos repetidos"
+            + (" ou já processados (índice local)" if usar_indice else "") + " foram ignorados."
         )
+
+    if not df.empty:
+        # Totais e linhas de cada prestador (CNPJ), calculados uma vez por upload
+        totais, linhas = cache.obter_ou_calcular(('prestadores', chave), lambda: agrupar_por_prestador(df))
+
+        if totais.empty:
+            st.warning("Nenhum prestador foi identificado nas notas dos arquivos fornecidos.")
+        elif len(totais) == 1:
+            cnpj = totais.index[0]
+            exibir_prestador(cache, chave, cnpj, totais.loc[cnpj], df)
+        else:
+            st.subheader(f"🏢 {len(totais)} prestadores")
+            exibir_totais_prestadores(totais)
+
+            abas = st.tabs([f"{totais.at[cnpj, 'razao_social']} ({format_cpf_cnpj(cnpj)})" for cnpj in totais.index])
+            for aba, cnpj in zip(abas, totais.index):
+                with aba:
+                    exibir_prestador(cache, chave, cnpj, totais.loc[cnpj], df.iloc[linhas[cnpj]].reset_index(drop=True), sufixo=f"_{cnpj}")
     else:
-        st.warning("Nenhum dado de NFS-e foi encontrado nos arquivos fornecidos.")
\ No newline at end of file
+        st.warning("Nenhum dado de NFS-e foi encontrado nos arquivos fornecidos.")
+elif 'extracao' in st.session_state:
+    # Arquivos removidos: a extração que ainda estiver rodando é cancelada
+    st.session_state.pop('extracao')[1].cancelar()
@@ -0,0 +1,52 @@
+# Vazão dos leitores de XML da extração (extracao.BACKENDS), num lote grande
+# e em arquivos de uma nota cada. Que o ElementTree e o lxml geram as mesmas
+# notas é conferido em tests/test_backends.py.
+#
+# Uso: python benchmarks/bench_backends.py [--notas 20000] [--repeticoes 3]
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import gerar_arquivos, gerar_lote
+from extracao import BACKENDS, ColetorNotas, ler_xml, lxml_etree
+
+def ler(conteudos, backend):
+    coletor = ColetorNotas()
+    emitentes = [ler_xml(io.BytesIO(conteudo.encode('utf-8')), coletor, backend) for conteudo in conteudos]
+    return coletor.para_dataframe(), emitentes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Vazão dos leitores de XML (ElementTree e lxml).')
+    parser.add_argument('--notas', type=int, default=20000, help='notas do lote e dos arquivos de uma nota medidos')
+    parser.add_argument('--repeticoes', type=int, default=3, help='repetições da medição (vale a melhor)')
+    args = parser.parse_args(argv)
+
+    if lxml_etree is None:
+        print('lxml não está instalado: só o ElementTree está disponível.')
+        return 1
+
+    corpora = {
+        'lote': [gerar_lote(args.notas, prestadores=3, meses=12, proporcao_cpf=0.2)],
+        'uma nota por arquivo': [conteudo for _, conteudo in gerar_arquivos(args.notas, 1)],
+    }
+    for nome, conteudos in corpora.items():
+        megabytes = sum(len(conteudo) for conteudo in conteudos) / 1e6
+        tempos = {}
+        print(f'{nome} ({len(conteudos)} arquivos, {megabytes:.1f} MB)')
+        for backend in BACKENDS:
+            tempos[backend] = float('inf')
+            for _ in range(args.repeticoes):
+                inicio = time.perf_counter()
+                ler(conteudos, backend)
+                tempos[backend] = min(tempos[backend], time.perf_counter() - inicio)
+            print(f'  {backend:6} {args.notas / tempos[backend]:9.0f} notas/s {megabytes / tempos[backend]:6.1f} MB/s '
+                  f'{tempos[backend] / args.notas * 1e6:7.1f} µs/nota')
+        print(f'  Ganho do lxml: {tempos["etree"] / tempos["lxml"]:.2f}x')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
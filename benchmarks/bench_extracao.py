@@ -0,0 +1,123 @@
+# Compara o custo por nota do extrator de passada única (extrair_nota, com o
+# plano compilado de extracao.extrair_campos) com a implementação anterior,
+# que fazia um nfse.find('.//ns:...') por campo.
+#
+# Uso: python benchmarks/bench_extracao.py [--notas 5000]
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import gerar_lote
+from extracao import NAMESPACE_ABRASF, NOMES_COLUNAS, centavos, compilar_plano, emitente_nota, extrair_campos, valores_nota
+
+def extrair_nota(nfse, plano, extrair_emitente=False):
+    # Linha de uma nota como a de extrair_nota_find, a partir do plano compilado
+    campos = extrair_campos(nfse, plano)
+    registro = dict(zip(NOMES_COLUNAS, valores_nota(campos)))
+    registro["Data de Emissão"] = formatar_data(registro["Data de Emissão"])
+    return registro, emitente_nota(campos) if extrair_emitente else None
+
+def formatar_data(texto):
+    # Data de emissão como DD/MM/AAAA, do mesmo jeito que extrair_nota_find
+    try:
+        return datetime.fromisoformat(texto).strftime('%d/%m/%Y') if texto else 'N/A'
+    except ValueError:
+        return 'N/A'
+
+def extrair_nota_find(nfse, ns):
+    # Implementação anterior: uma busca de descendentes por campo.
+    def texto(caminho, padrao):
+        elemento = nfse.find(caminho, ns)
+        return elemento.text if elemento is not None else padrao
+
+    emitente_info = {
+        'cnpj': texto('.//ns:Prestador/ns:CpfCnpj/ns:Cnpj', 'N/A'),
+        'razao_social': texto('.//ns:Prestador/ns:RazaoSocial', 'N/A')
+    }
+
+    cpf_cnpj_tomador_element = nfse.find('.//ns:IdentificacaoTomador/ns:CpfCnpj', ns)
+    if cpf_cnpj_tomador_element is not None:
+        cpf_tomador = cpf_cnpj_tomador_element.find('.//ns:Cpf', ns)
+        cnpj_tomador = cpf_cnpj_tomador_element.find('.//ns:Cnpj', ns)
+        cpf_cnpj_valor = cpf_tomador.text if cpf_tomador is not None else cnpj_tomador.text if cnpj_tomador is not None else 'N/A'
+    else:
+        cpf_cnpj_valor = 'N/A'
+
+    valor_iss = texto('.//ns:ValoresNfse/ns:ValorIss', 'N/A')
+
+    data_emissao_element = nfse.find('.//ns:DataEmissao', ns)
+    if data_emissao_element is not None and data_emissao_element.text:
+        try:
+            data_emissao = datetime.fromisoformat(data_emissao_element.text).strftime('%d/%m/%Y')
+        except:
+            data_emissao = 'N/A'
+    else:
+        data_emissao = 'N/A'
+
+    registro = {
+        "CPF/CNPJ Tomador": cpf_cnpj_valor,
+        "Razão Social Tomador": texto('.//ns:Tomador/ns:RazaoSocial', 'N/A'),
+        "Número NFS-e": texto('.//ns:Numero', 'N/A'),
+        "Valor do Serviço": centavos(texto('.//ns:Servico/ns:Valores/ns:ValorServicos', '0')),
+        "Alíquota": "3%",
+        "ISS": centavos(valor_iss) if valor_iss != 'N/A' else 0,
+        "ISS Retido": "Sim" if texto('.//ns:Servico/ns:IssRetido', '2') == "1" else "Não",
+        "Data de Emissão": data_emissao,
+        "Item": texto('.//ns:Servico/ns:ItemListaServico', 'N/A'),
+        "Código NBS": texto('.//ns:Servico/ns:CodigoNbs', 'N/A'),
+        "Código CNAE": texto('.//ns:Servico/ns:CodigoCnae', 'N/A'),
+        "Base de Cálculo IBSCBS": centavos(texto('.//ns:IBSCBS/ns:valores/ns:vBC', '0')),
+        "pIBSUF": float(texto('.//ns:IBSCBS/ns:valores/ns:uf/ns:pIBSUF', '0')),
+        "pRedAliqUF": float(texto('.//ns:IBSCBS/ns:valores/ns:uf/ns:pRedAliqUF', '0')),
+        "pAliqEfetUF": float(texto('.//ns:IBSCBS/ns:valores/ns:uf/ns:pAliqEfetUF', '0')),
+        "pRedAliqMun": float(texto('.//ns:IBSCBS/ns:valores/ns:mun/ns:pRedAliqMun', '0')),
+        "pCBS": float(texto('.//ns:IBSCBS/ns:valores/ns:fed/ns:pCBS', '0')),
+        "pRedAliqCBS": float(texto('.//ns:IBSCBS/ns:valores/ns:fed/ns:pRedAliqCBS', '0')),
+        "pAliqEfetCBS": float(texto('.//ns:IBSCBS/ns:valores/ns:fed/ns:pAliqEfetCBS', '0')),
+        "vIBSUF": centavos(texto('.//ns:IBSCBS/ns:totCIBS/ns:gIBS/ns:gIBSUFTot/ns:vIBSUF', '0')),
+        "vCBS": centavos(texto('.//ns:IBSCBS/ns:totCIBS/ns:gCBS/ns:vCBS', '0')),
+        "Descrição do Serviço": texto('.//ns:Servico/ns:Discriminacao', 'N/A'),
+        "CNPJ Prestador": emitente_info['cnpj'],
+        "Razão Social Prestador": emitente_info['razao_social']
+    }
+
+    return registro, emitente_info
+
+def cronometrar(funcao, notas, repeticoes=3):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for nfse in notas:
+            funcao(nfse)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Custo por nota do extrator de passada única contra o de um find por campo.')
+    parser.add_argument('--notas', type=int, default=5000, help='notas do lote medido')
+    quantidade = parser.parse_args(argv).notas
+    ns = {'ns': NAMESPACE_ABRASF}
+    plano = compilar_plano(NAMESPACE_ABRASF)
+
+    root = ET.fromstring(gerar_lote(quantidade))
+    notas = root.findall('.//ns:InfNfse', ns)
+
+    # Os dois extratores devem produzir exatamente as mesmas linhas
+    for nfse in notas:
+        assert extrair_nota(nfse, plano, True) == extrair_nota_find(nfse, ns)
+
+    tempo_find = cronometrar(lambda nfse: extrair_nota_find(nfse, ns), notas)
+    tempo_plano = cronometrar(lambda nfse: extrair_nota(nfse, plano, True), notas)
+
+    print(f'Notas: {len(notas)}')
+    print(f'find() por campo:  {tempo_find / len(notas) * 1e6:8.1f} µs/nota')
+    print(f'plano compilado:   {tempo_plano / len(notas) * 1e6:8.1f} µs/nota')
+    print(f'Ganho:             {tempo_find / tempo_plano:8.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Tempo e pico de memória de cada fase do processamento de um corpus:
+# extração dos XMLs (ler_xml, usado por processar_xml, via processar_membros),
+# montagem do DataFrame, formatação da tabela, planilha Excel e relatório HTML.
+# Cada execução é acrescentada a um arquivo JSON Lines com o commit atual e
+# comparada com a última execução de outro commit sobre o mesmo corpus.
+#
+# Uso: python benchmarks/bench_fases.py [ENTRADA ...] [--notas 100000]
+#          [--workers 1] [--memoria] [--resultados benchmarks/resultados/fases.jsonl]
+# Sem ENTRADA, um corpus ZIP com --notas notas é gerado numa pasta temporária.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime
+
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from corpus import escrever_corpus
+from exportacao import cols_to_format_currency, formatos_excel, gerar_excel, preparar_tabela
+from extracao import ColetorNotas, ler_caminho, listar_membros, processar_membros
+from relatorio import relatorio_html
+from resumos import agrupar_por_prestador
+from tabela import formatar_pagina
+
+RESULTADOS_PADRAO = os.path.join(RAIZ, 'benchmarks', 'resultados', 'fases.jsonl')
+
+def commit_atual():
+    # Hash do commit e se há alterações não commitadas (None fora de um repositório git)
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+def medir(fases, nome, funcao, memoria=False):
+    # Executa a fase e guarda o tempo; com memoria, executa de novo sob o
+    # tracemalloc para o pico (a segunda execução não entra no tempo)
+    inicio = time.perf_counter()
+    resultado = funcao()
+    fases[nome] = {'segundos': round(time.perf_counter() - inicio, 4)}
+    if memoria:
+        tracemalloc.start()
+        funcao()
+        fases[nome]['pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+    return resultado
+
+def executar_fases(caminhos, workers=1, tamanho_lote=64, memoria=False):
+    fases = {}
+
+    def extrair():
+        coletor = ColetorNotas()
+        with ExitStack() as pilha:
+            membros = listar_membros(((caminho, caminho) for caminho in caminhos), ler_caminho, pilha)
+            for _, notas, _, _ in processar_membros(lambda membro: membro[0](membro[1]), membros, workers, tamanho_lote):
+                coletor.estender(notas)
+        return coletor
+
+    def relatorios():
+        totais, linhas = agrupar_por_prestador(df)
+        return sum(
+            len(relatorio_html({'cnpj': cnpj, 'razao_social': totais.at[cnpj, 'razao_social']}, totais.loc[cnpj], df.iloc[linhas[cnpj]]))
+            for cnpj in totais.index
+        )
+
+    coletor = medir(fases, 'extracao', extrair, memoria)
+    df = medir(fases, 'dataframe', coletor.para_dataframe, memoria)
+    tabela = medir(fases, 'formatacao', lambda: preparar_tabela(df), memoria)
+    medir(fases, 'formatacao_exibicao', lambda: formatar_pagina(tabela), memoria)
+    medir(fases, 'excel', lambda: gerar_excel(tabela, formatos_excel, cols_to_format_currency), memoria)
+    medir(fases, 'html', relatorios, memoria)
+    return len(df), fases
+
+def ultima_de_outro_commit(caminho, registro):
+    # Última execução gravada sobre o mesmo corpus (notas, bytes e workers) em outro commit
+    if not os.path.exists(caminho):
+        return None
+    anterior = None
+    with open(caminho, encoding='utf-8') as arquivo:
+        for linha in arquivo:
+            candidato = json.loads(linha)
+            if candidato['corpus'] == registro['corpus'] and candidato['workers'] == registro['workers'] and candidato['commit'] != registro['commit']:
+                anterior = candidato
+    return anterior
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark por fase do processamento de NFS-e.')
+    parser.add_argument('entradas', nargs='*', help='arquivos .xml/.zip (sem entradas, gera um corpus sintético)')
+    parser.add_argument('--notas', type=int, default=100_000, help='notas do corpus gerado quando não há entradas')
+    parser.add_argument('--notas-por-arquivo', type=int, default=50, help='notas por XML do corpus gerado')
+    parser.add_argument('--workers', type=int, default=1, help='processos paralelos na extração')
+    parser.add_argument('--memoria', action='store_true', help='mede também o pico de memória (tracemalloc) de cada fase')
+    parser.add_argument('--resultados', default=RESULTADOS_PADRAO, help='arquivo JSON Lines onde as execuções são acumuladas')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporaria:
+        caminhos = args.entradas or [escrever_corpus(temporaria, args.notas, args.notas_por_arquivo)]
+        total_bytes = sum(os.path.getsize(caminho) for caminho in caminhos)
+        notas, fases = executar_fases(caminhos, args.workers, memoria=args.memoria)
+
+    commit, sujo = commit_atual()
+    registro = {
+        'commit': commit,
+        'alteracoes_locais': sujo,
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'corpus': {'notas': notas, 'bytes': total_bytes, 'arquivos': [os.path.basename(caminho) for caminho in caminhos]},
+        'workers': args.workers,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'fases': fases,
+    }
+    anterior = ultima_de_outro_commit(args.resultados, registro)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.resultados)), exist_ok=True)
+    with open(args.resultados, 'a', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+    print(f'Commit: {commit}{" (com alterações locais)" if sujo else ""}   Notas: {notas}   {total_bytes / 1e6:.1f} MB')
+    if anterior:
+        print(f'Comparado com {anterior["commit"]} ({anterior["data"]})')
+    for nome, medidas in fases.items():
+        linha = f'{nome:20s} {medidas["segundos"]:9.3f} s'
+        if 'pico_mb' in medidas:
+            linha += f' {medidas["pico_mb"]:10.1f} MB'
+        if anterior and nome in anterior['fases']:
+            antes = anterior['fases'][nome]['segundos']
+            linha += f'   {antes:9.3f} s antes ({(medidas["segundos"] - antes) / antes * 100:+.1f}%)' if antes else ''
+        print(linha)
+
+if __name__ == '__main__':
+    main()
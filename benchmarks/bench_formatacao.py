@@ -0,0 +1,77 @@
+# Compara os formatadores vetorizados de formatacao (formatar_cpf_cnpj,
+# formatar_centavos, formatar_datas) com funções escalares aplicadas célula a
+# célula, conferindo antes que o texto produzido é exatamente o mesmo. As
+# referências de moeda (a partir do float em reais) e de data ficam aqui.
+#
+# Uso: python benchmarks/bench_formatacao.py [--linhas 1000000]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatacao import format_centavos, format_cpf_cnpj, formatar_centavos, formatar_cpf_cnpj, formatar_datas
+
+def format_brazilian_currency(value):
+    # Referência: valor em reais (float) no padrão brasileiro, R$ 1.234,56
+    return f'R$ {float(value):,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+def format_data(value):
+    # Referência: DD/MM/AAAA, e N/A para datas ausentes
+    if pd.isna(value):
+        return 'N/A'
+    return value.strftime('%d/%m/%Y')
+
+def gerar_colunas(quantidade, tomadores=5000):
+    # Tomadores se repetem entre as notas; valores e datas como nos XMLs
+    gerador = np.random.default_rng(0)
+    documentos = np.array(
+        [f'{numero:014d}' if numero % 3 else f'{numero % 10 ** 11:011d}' for numero in gerador.integers(0, 10 ** 14, tomadores)] + ['N/A'],
+        dtype=object
+    )
+    valores = gerador.uniform(0, 250_000, quantidade).round(2)
+    return pd.DataFrame({
+        'documento': pd.Series(gerador.choice(documentos, quantidade), dtype=object),
+        'valor': valores,
+        'centavos': np.rint(valores * 100).astype(np.int64),
+        'data': pd.Timestamp('2025-01-01') + pd.to_timedelta(gerador.integers(0, 365 * 86400, quantidade), unit='s'),
+    })
+
+def cronometrar(funcao, repeticoes=3):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Formatadores vetorizados contra funções escalares aplicadas célula a célula.')
+    parser.add_argument('--linhas', type=int, default=1_000_000, help='linhas das colunas formatadas')
+    quantidade = parser.parse_args(argv).linhas
+    df = gerar_colunas(quantidade)
+    # A versão célula a célula é medida numa amostra e extrapolada
+    amostra = df.iloc[:min(quantidade, 100_000)]
+    fator = quantidade / len(amostra)
+
+    casos = [
+        ('CPF/CNPJ', 'documento', format_cpf_cnpj, formatar_cpf_cnpj),
+        ('Moeda', 'centavos', format_centavos, formatar_centavos),
+        ('Data', 'data', format_data, formatar_datas),
+    ]
+
+    assert formatar_centavos(amostra['centavos']).tolist() == amostra['valor'].map(format_brazilian_currency).tolist()
+
+    print(f'Linhas: {quantidade}')
+    for nome, coluna, escalar, vetorizada in casos:
+        assert vetorizada(amostra[coluna]).tolist() == amostra[coluna].map(escalar).tolist()
+        tempo_escalar = cronometrar(lambda: amostra[coluna].map(escalar), repeticoes=1) * fator
+        tempo_vetorizado = cronometrar(lambda: vetorizada(df[coluna]))
+        print(f'{nome:9s} célula a célula: {tempo_escalar:7.3f} s   vetorizado: {tempo_vetorizado:7.3f} s   ganho: {tempo_escalar / tempo_vetorizado:6.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Vazão da extração por leiaute de NFS-e: ABRASF (com o namespace padrão, sem
+# namespace e com o namespace de outro município), nacional (NFSe/infNFSe) e
+# um ZIP misto. As mesmas notas são geradas em cada leiaute e o DataFrame de
+# cada um é comparado com o do ABRASF, nas colunas que existem nos dois.
+#
+# Uso: python benchmarks/bench_leiautes.py [--notas 20000] [--notas-por-arquivo 50]
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import gerar_arquivos
+from extracao import NAMESPACE_ABRASF, extrair_dados_arquivos
+
+NAMESPACE_MUNICIPAL = 'http://nfse.municipio.exemplo.gov.br/nfse.xsd'
+
+# Colunas que dependem do leiaute: o nacional não tem CNAE, usa o código de
+# tributação nacional como item e traz a razão social do emitente
+COLUNAS_DO_LEIAUTE = ['Item', 'Código CNAE', 'Razão Social Prestador']
+
+def variantes(quantidade, notas_por_arquivo):
+    # nome -> função que devolve os arquivos (nome, conteúdo) do corpus
+    def abrasf(namespace):
+        for nome, conteudo in gerar_arquivos(quantidade, notas_por_arquivo, leiaute='abrasf'):
+            atributo = f' xmlns="{namespace}"' if namespace else ''
+            yield nome, conteudo.replace(f' xmlns="{NAMESPACE_ABRASF}"', atributo)
+
+    return {
+        'abrasf': lambda: abrasf(NAMESPACE_ABRASF),
+        'abrasf_sem_namespace': lambda: abrasf(None),
+        'abrasf_municipal': lambda: abrasf(NAMESPACE_MUNICIPAL),
+        'nacional': lambda: gerar_arquivos(quantidade, notas_por_arquivo, leiaute='nacional'),
+        'misto': lambda: gerar_arquivos(quantidade, notas_por_arquivo, leiaute='misto'),
+    }
+
+def gravar_zip(caminho, arquivos):
+    with zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for nome, conteudo in arquivos:
+            zip_ref.writestr(nome, conteudo)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Vazão da extração por leiaute de NFS-e.')
+    parser.add_argument('--notas', type=int, default=20000, help='notas geradas em cada leiaute')
+    parser.add_argument('--notas-por-arquivo', type=int, default=50, help='notas por lote ABRASF (o nacional tem uma nota por arquivo)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        referencia = None
+        print(f'{"leiaute":22} {"arquivos":>8} {"notas":>8} {"MB":>7} {"notas/s":>9} {"MB/s":>6}')
+        for nome, gerar in variantes(args.notas, args.notas_por_arquivo).items():
+            caminho = os.path.join(pasta, f'{nome}.zip')
+            gravar_zip(caminho, gerar())
+            with zipfile.ZipFile(caminho) as zip_ref:
+                arquivos = len(zip_ref.infolist())
+                megabytes = sum(info.file_size for info in zip_ref.infolist()) / 1e6
+
+            inicio = time.perf_counter()
+            df, _ = extrair_dados_arquivos([caminho])
+            segundos = time.perf_counter() - inicio
+
+            # Mesmas notas, mesmas linhas em todos os leiautes
+            assert len(df) == args.notas, (nome, len(df))
+            comparaveis = df.drop(columns=COLUNAS_DO_LEIAUTE).astype(str)
+            if referencia is None:
+                referencia = comparaveis
+            else:
+                diferentes = [coluna for coluna in referencia.columns if not referencia[coluna].equals(comparaveis[coluna])]
+                assert not diferentes, (nome, diferentes)
+
+            print(f'{nome:22} {arquivos:8d} {len(df):8d} {megabytes:7.1f} {len(df) / segundos:9.0f} {megabytes / segundos:6.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Relatório de memória: DataFrame montado a partir de uma lista de dicts (um
+# por nota, como era feito) contra o ColetorNotas colunar e tipado.
+#
+# Uso: python benchmarks/bench_memoria.py [--notas 50000]
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import gerar_lote
+from extracao import ColetorNotas, ler_xml, processar_xml
+
+def montar_por_dicts(conteudo):
+    dados, _ = processar_xml(io.BytesIO(conteudo))
+    return pd.DataFrame(dados)
+
+def montar_colunar(conteudo):
+    coletor = ColetorNotas()
+    ler_xml(io.BytesIO(conteudo), coletor)
+    return coletor.para_dataframe()
+
+def medir(funcao, conteudo):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    df = funcao(conteudo)
+    tempo = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, tempo, pico
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memória do DataFrame montado por lista de dicts contra o ColetorNotas colunar.')
+    parser.add_argument('--notas', type=int, default=50000, help='notas do lote medido')
+    quantidade = parser.parse_args(argv).notas
+    conteudo = gerar_lote(quantidade).encode('utf-8')
+
+    resultados = {}
+    for nome, funcao in (('lista de dicts', montar_por_dicts), ('colunar tipado', montar_colunar)):
+        df, tempo, pico = medir(funcao, conteudo)
+        resultados[nome] = (df, tempo, pico, int(df.memory_usage(deep=True).sum()))
+
+    print(f'Notas: {quantidade}  XML: {len(conteudo) / 1e6:.1f} MB')
+    print(f'{"":16} {"tempo (s)":>10} {"pico (MB)":>10} {"DataFrame (MB)":>15}')
+    for nome, (_, tempo, pico, tamanho) in resultados.items():
+        print(f'{nome:16} {tempo:10.2f} {pico / 1e6:10.1f} {tamanho / 1e6:15.1f}')
+
+    print()
+    print('Memória por coluna (MB):')
+    por_dicts = resultados['lista de dicts'][0].memory_usage(deep=True, index=False)
+    colunar = resultados['colunar tipado'][0]
+    for coluna, tamanho in colunar.memory_usage(deep=True, index=False).items():
+        # As linhas de processar_xml não trazem o prestador de cada nota
+        antes = f'{por_dicts[coluna] / 1e6:8.2f}' if coluna in por_dicts else f'{"-":>8}'
+        print(f'  {coluna:24} {antes} -> {tamanho / 1e6:8.2f}  ({colunar[coluna].dtype})')
+
+if __name__ == '__main__':
+    main()
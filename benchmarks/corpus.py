@@ -0,0 +1,144 @@
+# Gerador de um corpus sintético de NFS-e no layout ABRASF ou nacional, para
+# os benchmarks: notas com e sem o grupo IBSCBS (valores/totCIBS), tomadores
+# com CPF ou CNPJ, vários prestadores e meses de emissão. Grava arquivos de uma
+# nota (CompNfse ou NFSe), lotes ABRASF (ConsultarNfseResposta/ListaNfse) ou
+# ZIPs com esses arquivos; no corpus misto, os leiautes se alternam por arquivo.
+#
+# Uso: python benchmarks/corpus.py DESTINO [--notas 1000 100000 1000000]
+#          [--notas-por-arquivo 50] [--formato zip|xml] [--prestadores 3]
+#          [--leiaute abrasf|nacional|misto]
+import argparse
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extracao import NAMESPACE_ABRASF, NAMESPACE_NACIONAL
+
+NOTA_XML = """<CompNfse><Nfse versao="2.04"><InfNfse Id="N{i}">
+<Numero>{i}</Numero><CodigoVerificacao>ABC{i}</CodigoVerificacao><DataEmissao>{ano}-{mes:02d}-{dia:02d}T10:15:00</DataEmissao>
+<ValoresNfse><BaseCalculo>{valor}</BaseCalculo><Aliquota>3.00</Aliquota><ValorIss>{iss}</ValorIss><ValorLiquidoNfse>{valor}</ValorLiquidoNfse></ValoresNfse>
+<PrestadorServico><IdentificacaoPrestador><CpfCnpj><Cnpj>{prestador}</Cnpj></CpfCnpj></IdentificacaoPrestador>
+<RazaoSocial>EMPRESA PRESTADORA {numero_prestador} LTDA</RazaoSocial><Endereco><Endereco>RUA A</Endereco><Numero>100</Numero></Endereco></PrestadorServico>
+<DeclaracaoPrestacaoServico><InfDeclaracaoPrestacaoServico><Competencia>{ano}-{mes:02d}-01</Competencia>
+<Servico><Valores><ValorServicos>{valor}</ValorServicos></Valores><IssRetido>{retido}</IssRetido>
+<ItemListaServico>01.07</ItemListaServico><CodigoCnae>6201501</CodigoCnae><CodigoNbs>115013000</CodigoNbs>
+<Discriminacao>Desenvolvimento de software - nota {i}</Discriminacao></Servico>
+<Prestador><CpfCnpj><Cnpj>{prestador}</Cnpj></CpfCnpj></Prestador>
+<Tomador><IdentificacaoTomador><CpfCnpj>{documento_tomador}</CpfCnpj></IdentificacaoTomador>
+<RazaoSocial>CLIENTE {tomador}</RazaoSocial><Endereco><Endereco>RUA B</Endereco><Numero>200</Numero></Endereco></Tomador>
+{ibscbs}</InfDeclaracaoPrestacaoServico></DeclaracaoPrestacaoServico></InfNfse></Nfse></CompNfse>"""
+
+IBSCBS_XML = """<IBSCBS><valores><vBC>{valor}</vBC>
+<uf><pIBSUF>0.10</pIBSUF><pRedAliqUF>0.00</pRedAliqUF><pAliqEfetUF>0.10</pAliqEfetUF></uf>
+<mun><pIBSMun>0.00</pIBSMun><pRedAliqMun>0.00</pRedAliqMun><pAliqEfetMun>0.00</pAliqEfetMun></mun>
+<fed><pCBS>0.90</pCBS><pRedAliqCBS>0.00</pRedAliqCBS><pAliqEfetCBS>0.90</pAliqEfetCBS></fed></valores>
+<totCIBS><vTotNF>{valor}</vTotNF><gIBS><vIBSTot>{ibs}</vIBSTot><gIBSUFTot><vDifUF>0.00</vDifUF><vIBSUF>{ibs}</vIBSUF></gIBSUFTot></gIBS>
+<gCBS><vDifCBS>0.00</vDifCBS><vCBS>{cbs}</vCBS></gCBS></totCIBS></IBSCBS>"""
+
+# Mesma nota no leiaute nacional: NFSe/infNFSe com a DPS dentro
+NOTA_NACIONAL_XML = """<NFSe versao="1.00"><infNFSe Id="NFS{i}">
+<xLocEmi>Sao Paulo</xLocEmi><xLocPrestacao>Sao Paulo</xLocPrestacao><nNFSe>{i}</nNFSe><cLocIncid>3550308</cLocIncid>
+<xTribNac>Desenvolvimento de programas</xTribNac><verAplic>1.0</verAplic><ambGer>2</ambGer><tpEmis>1</tpEmis><cStat>100</cStat>
+<dhProc>{ano}-{mes:02d}-{dia:02d}T10:16:00-03:00</dhProc><nDFSe>{i}</nDFSe>
+<emit><CNPJ>{prestador}</CNPJ><xNome>EMPRESA PRESTADORA {numero_prestador} LTDA</xNome><enderNac><xLgr>RUA A</xLgr><nro>100</nro></enderNac></emit>
+<valores><vBC>{valor}</vBC><pAliqAplic>3.00</pAliqAplic><vISSQN>{iss}</vISSQN><vLiq>{valor}</vLiq></valores>
+{ibscbs}<DPS versao="1.00"><infDPS Id="DPS{i}"><tpAmb>2</tpAmb><dhEmi>{ano}-{mes:02d}-{dia:02d}T10:15:00-03:00</dhEmi>
+<serie>1</serie><nDPS>{i}</nDPS><dCompet>{ano}-{mes:02d}-01</dCompet><tpEmit>1</tpEmit>
+<prest><CNPJ>{prestador}</CNPJ><regTrib><opSimpNac>1</opSimpNac></regTrib></prest>
+<toma>{documento_tomador}<xNome>CLIENTE {tomador}</xNome></toma>
+<serv><locPrest><cLocPrestacao>3550308</cLocPrestacao></locPrest><cServ><cTribNac>010101</cTribNac>
+<xDescServ>Desenvolvimento de software - nota {i}</xDescServ><cNBS>115013000</cNBS></cServ></serv>
+<valores><vServPrest><vServ>{valor}</vServ></vServPrest><trib><tribMun><tribISSQN>1</tribISSQN><tpRetISSQN>{retido}</tpRetISSQN></tribMun></trib></valores>
+</infDPS></DPS></infNFSe></NFSe>"""
+
+# CNPJs dos prestadores do corpus; o primeiro é o dos lotes de gerar_lote
+PRESTADORES = ['11222333000181', '22333444000172', '33444555000163', '44555666000154', '55666777000145']
+
+def gerar_notas(quantidade, inicio=1, prestadores=1, meses=1, proporcao_cpf=0.0, leiaute='abrasf'):
+    # Textos das notas (CompNfse, ou NFSe no leiaute nacional) numeradas de
+    # inicio em diante. Um terço não tem o grupo IBSCBS; prestadores, meses (a
+    # partir de 03/2025) e tomadores com CPF se alternam pelo número da nota.
+    # As notas de mesmo número têm os mesmos valores nos dois leiautes.
+    nacional = leiaute == 'nacional'
+    a_cada_cpf = round(1 / proporcao_cpf) if proporcao_cpf else 0
+    for i in range(inicio, inicio + quantidade):
+        valor = 100 + i % 5000
+        tomador = 10_000_000_000 + i % 500
+        if a_cada_cpf and i % a_cada_cpf == 0:
+            documento_tomador = f'<CPF>{tomador % 10 ** 11:011d}</CPF>' if nacional else f'<Cpf>{tomador % 10 ** 11:011d}</Cpf>'
+        else:
+            documento_tomador = f'<CNPJ>{tomador:014d}</CNPJ>' if nacional else f'<Cnpj>{tomador:014d}</Cnpj>'
+        mes = 3 + i % meses
+        ibscbs = IBSCBS_XML.format(valor=f'{valor:.2f}', ibs=f'{valor * 0.001:.2f}', cbs=f'{valor * 0.009:.2f}') if i % 3 else ''
+        # IssRetido 1 = retido; no nacional, tpRetISSQN 2 = retido pelo tomador e 1 = não retido
+        retido = 1 + i % 2
+        yield (NOTA_NACIONAL_XML if nacional else NOTA_XML).format(
+            i=i, dia=1 + i % 28, ano=2025 + (mes - 1) // 12, mes=(mes - 1) % 12 + 1,
+            valor=f'{valor:.2f}', iss=f'{valor * 0.03:.2f}', retido=3 - retido if nacional else retido,
+            prestador=PRESTADORES[i % prestadores], numero_prestador=i % prestadores + 1,
+            tomador=tomador, documento_tomador=documento_tomador, ibscbs=ibscbs
+        )
+
+def gerar_lote(quantidade, inicio=1, prestadores=1, meses=1, proporcao_cpf=0.0):
+    # Arquivo de lote: ConsultarNfseResposta com as notas em ListaNfse
+    notas = ''.join(gerar_notas(quantidade, inicio, prestadores, meses, proporcao_cpf))
+    return f'<ConsultarNfseResposta xmlns="{NAMESPACE_ABRASF}"><ListaNfse>{notas}</ListaNfse></ConsultarNfseResposta>'
+
+def gerar_nota_unica(nota):
+    # Arquivo de uma nota só: o próprio CompNfse (ou NFSe) como raiz
+    if nota.startswith('<NFSe '):
+        return nota.replace('<NFSe ', f'<NFSe xmlns="{NAMESPACE_NACIONAL}" ', 1)
+    return nota.replace('<CompNfse>', f'<CompNfse xmlns="{NAMESPACE_ABRASF}">', 1)
+
+def gerar_arquivos(quantidade, notas_por_arquivo=50, prestadores=3, meses=12, proporcao_cpf=0.2, leiaute='abrasf'):
+    # (nome, conteúdo) de cada arquivo XML do corpus, sem montar todos na memória.
+    # O leiaute nacional não tem lotes: cada nota é um arquivo. No misto, os
+    # grupos de notas_por_arquivo notas se alternam entre um lote ABRASF e
+    # arquivos nacionais de uma nota.
+    for grupo, inicio in enumerate(range(1, quantidade + 1, notas_por_arquivo)):
+        tamanho = min(notas_por_arquivo, quantidade - inicio + 1)
+        leiaute_grupo = ('abrasf', 'nacional')[grupo % 2] if leiaute == 'misto' else leiaute
+        if leiaute_grupo == 'abrasf' and notas_por_arquivo > 1:
+            yield f'lote_{inicio:07d}.xml', gerar_lote(tamanho, inicio, prestadores, meses, proporcao_cpf)
+            continue
+        for numero, nota in enumerate(gerar_notas(tamanho, inicio, prestadores, meses, proporcao_cpf, leiaute_grupo), inicio):
+            yield f'nfse_{numero:07d}.xml', gerar_nota_unica(nota)
+
+def escrever_corpus(destino, quantidade, notas_por_arquivo=50, formato='zip', prestadores=3, meses=12, proporcao_cpf=0.2, leiaute='abrasf'):
+    # Grava o corpus em destino: um ZIP corpus_<quantidade>.zip ou uma pasta
+    # corpus_<quantidade>/ com os XMLs (com o leiaute no nome, se não for o
+    # ABRASF). Devolve o caminho gravado.
+    os.makedirs(destino, exist_ok=True)
+    arquivos = gerar_arquivos(quantidade, notas_por_arquivo, prestadores, meses, proporcao_cpf, leiaute)
+    quantidade = quantidade if leiaute == 'abrasf' else f'{leiaute}_{quantidade}'
+    if formato == 'zip':
+        caminho = os.path.join(destino, f'corpus_{quantidade}.zip')
+        with zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+            for nome, conteudo in arquivos:
+                zip_ref.writestr(nome, conteudo)
+    else:
+        caminho = os.path.join(destino, f'corpus_{quantidade}')
+        os.makedirs(caminho, exist_ok=True)
+        for nome, conteudo in arquivos:
+            with open(os.path.join(caminho, nome), 'w', encoding='utf-8') as arquivo:
+                arquivo.write(conteudo)
+    return caminho
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera um corpus sintético de NFS-e (ABRASF ou nacional) para benchmarks.')
+    parser.add_argument('destino', help='pasta onde o corpus é gravado')
+    parser.add_argument('--notas', type=int, nargs='+', default=[1000, 100_000, 1_000_000], help='quantidades de notas (um corpus por quantidade)')
+    parser.add_argument('--notas-por-arquivo', type=int, default=50, help='notas por XML (1 grava arquivos de uma nota só)')
+    parser.add_argument('--formato', choices=['zip', 'xml'], default='zip', help='um ZIP por corpus ou uma pasta de XMLs')
+    parser.add_argument('--prestadores', type=int, default=3, choices=range(1, len(PRESTADORES) + 1), help='quantidade de prestadores distintos')
+    parser.add_argument('--leiaute', choices=['abrasf', 'nacional', 'misto'], default='abrasf', help='leiaute das notas (misto alterna por arquivo)')
+    args = parser.parse_args(argv)
+
+    for quantidade in args.notas:
+        caminho = escrever_corpus(args.destino, quantidade, args.notas_por_arquivo, args.formato, args.prestadores, leiaute=args.leiaute)
+        print(f'{quantidade} notas -> {caminho}')
+
+if __name__ == '__main__':
+    main()
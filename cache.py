@@ -0,0 +1,63 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+def calcular_digest(conteudo):
+    # Identifica um upload (ou um XML dentro de um ZIP) pelo conteúdo, não pelo nome
+    return hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+
+def estimar_tamanho(valor):
+    # Estimativa em bytes usada apenas para decidir o que sai do cache
+    if isinstance(valor, (bytes, bytearray, str)):
+        return len(valor)
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(estimar_tamanho(item) for item in valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(estimar_tamanho(item) for item in valor.values())
+    return sys.getsizeof(valor)
+
+class CacheLRU:
+    # Cache LRU limitado pelo tamanho total estimado dos valores guardados.
+    # Compartilhado entre as sessões do Streamlit, por isso protegido por lock.
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            if chave not in self._itens:
+                return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave][0]
+
+    def guardar(self, chave, valor, tamanho=None):
+        tamanho = estimar_tamanho(valor) if tamanho is None else tamanho
+        with self._lock:
+            if chave in self._itens:
+                self.total_bytes -= self._itens.pop(chave)[1]
+            # Um valor maior que o cache inteiro não é guardado
+            if tamanho > self.max_bytes:
+                return valor
+            self._itens[chave] = (valor, tamanho)
+            self.total_bytes += tamanho
+            while self.total_bytes > self.max_bytes:
+                _, (_, tamanho_removido) = self._itens.popitem(last=False)
+                self.total_bytes -= tamanho_removido
+        return valor
+
+    def obter_ou_calcular(self, chave, funcao):
+        valor = self.obter(chave)
+        if valor is None:
+            valor = self.guardar(chave, funcao())
+        return valor
+
+    def __len__(self):
+        return len(self._itens)
@@ -0,0 +1,115 @@
+# Extração em lote, sem Streamlit:
+#
+#   python cli.py notas/ lotes/*.zip -o dados_nfse.xlsx --workers 8
+#
+# Aceita diretórios (percorridos recursivamente), padrões glob e arquivos
+# .xml/.zip, e grava a mesma tabela do botão "Baixar Planilha Excel" do app
+# em .xlsx, .csv ou .parquet. Com --dataset, as notas também são acrescentadas
+# ao dataset Parquet particionado por prestador e competência.
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+from exportacao import gravar_dataset, preparar_tabela, salvar_tabela
+from extracao import BACKEND_PADRAO, BACKENDS, extrair_dados_arquivos, lxml_etree
+from formatacao import format_centavos, format_cpf_cnpj
+from indice import IndiceNotas
+from metricas import MetricasExtracao
+from resumos import agrupar_por_prestador
+
+def listar_arquivos(entradas):
+    caminhos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            encontrados = glob.glob(os.path.join(glob.escape(entrada), '**', '*'), recursive=True)
+        else:
+            encontrados = glob.glob(entrada, recursive=True)
+        encontrados = sorted(caminho for caminho in encontrados if caminho.endswith(('.xml', '.zip')) and os.path.isfile(caminho))
+        if not encontrados:
+            print(f'Aviso: nenhum arquivo XML ou ZIP em {entrada}', file=sys.stderr)
+        caminhos.extend(encontrados)
+    # Remove repetições mantendo a ordem
+    return list(dict.fromkeys(caminhos))
+
+def configurar_log_json(caminho):
+    # Eventos de metricas (etapas, arquivos e resumo), um JSON por linha
+    handler = logging.FileHandler(caminho, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('nfse')
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extrai os dados de NFS-e (XML/ZIP) e grava a planilha sem abrir o Streamlit.')
+    parser.add_argument('entradas', nargs='+', help='diretórios, padrões glob ou arquivos .xml/.zip')
+    parser.add_argument('-o', '--saida', help='arquivo de saída (.xlsx, .csv ou .parquet)')
+    parser.add_argument('--dataset', help='diretório do dataset Parquet particionado ao qual as notas são acrescentadas')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processos paralelos (padrão: número de CPUs)')
+    parser.add_argument('--tamanho-lote', type=int, default=64, help='arquivos XML por lote enviado a cada processo')
+    parser.add_argument('--indice', help='banco SQLite com os arquivos e notas já processados, que passam a ser ignorados')
+    parser.add_argument('--log-json', help='arquivo onde as métricas de cada etapa e de cada XML são gravadas, uma linha JSON por evento')
+    parser.add_argument('--medir-memoria', action='store_true', help='mede o pico de memória de cada etapa (mais lento)')
+    parser.add_argument('--backend', choices=BACKENDS, default=BACKEND_PADRAO, help=f'leitor de XML (padrão: {BACKEND_PADRAO})')
+    args = parser.parse_args(argv)
+    if not args.saida and not args.dataset:
+        parser.error('informe --saida e/ou --dataset')
+    if args.backend == 'lxml' and lxml_etree is None:
+        parser.error('o backend lxml precisa do pacote lxml (pip install lxml)')
+
+    caminhos = listar_arquivos(args.entradas)
+    total_bytes = sum(os.path.getsize(caminho) for caminho in caminhos)
+
+    if args.log_json:
+        configurar_log_json(args.log_json)
+
+    inicio = time.perf_counter()
+    indice = IndiceNotas(args.indice) if args.indice else None
+    metricas = MetricasExtracao(medir_memoria=args.medir_memoria)
+    df, emitente = extrair_dados_arquivos(caminhos, workers=args.workers, tamanho_lote=args.tamanho_lote, indice=indice, metricas=metricas, backend=args.backend)
+    tempo_extracao = time.perf_counter() - inicio
+
+    for erro in metricas.erros:
+        print(f'Erro: {erro["arquivo"]}: {erro["erro"]}', file=sys.stderr)
+
+    deduplicacao = df.attrs.get('deduplicacao')
+    if deduplicacao and (deduplicacao['arquivos_ignorados'] or deduplicacao['notas_ignoradas']):
+        print(
+            f'Deduplicação: {deduplicacao["arquivos_ignorados"]} arquivos e {deduplicacao["notas_ignoradas"]} notas repetidos'
+            + (' ou já processados (índice)' if indice else '') + ' foram ignorados'
+        )
+
+    if df.empty:
+        print('Nenhum dado de NFS-e foi encontrado nos arquivos fornecidos.', file=sys.stderr)
+        return 1
+
+    if args.saida:
+        salvar_tabela(preparar_tabela(df), args.saida)
+    if args.dataset:
+        gravar_dataset(df, args.dataset)
+    tempo_total = time.perf_counter() - inicio
+
+    if emitente:
+        print(f'Emitente: {emitente["razao_social"]} ({format_cpf_cnpj(emitente["cnpj"])})')
+    print(f'Arquivos: {len(caminhos)} ({total_bytes / 1e6:.1f} MB)')
+    print(f'Notas: {len(df)}')
+    totais, _ = agrupar_por_prestador(df)
+    if len(totais) > 1:
+        for cnpj, linha in totais.iterrows():
+            print(f'  {format_cpf_cnpj(cnpj)} {linha["razao_social"]}: {linha["notas"]} notas, {format_centavos(linha["Valor do Serviço"])} em serviços')
+    print(f'Extração: {tempo_extracao:.2f} s ({len(df) / tempo_extracao:.0f} notas/s, {total_bytes / 1e6 / tempo_extracao:.1f} MB/s)')
+    for nome, etapa in metricas.etapas.items():
+        print(
+            f'  {nome}: {etapa["segundos"]:.2f} s'
+            + (f', pico {etapa["pico_mb"]:.1f} MB' if 'pico_mb' in etapa else '')
+            + (f', maior pico de um arquivo {etapa["pico_arquivo_max_mb"]:.1f} MB' if etapa.get('pico_arquivo_max_mb') is not None else '')
+        )
+    if metricas.erros:
+        print(f'Arquivos com erro: {len(metricas.erros)}')
+    print(f'Total com exportação: {tempo_total:.2f} s -> {", ".join(filter(None, [args.saida, args.dataset]))}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
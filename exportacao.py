@@ -0,0 +1,334 @@
+import io
+import os
+import zipfile
+from decimal import Decimal
+from functools import reduce
+
+import uuid
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from extracao import COLUNAS_CENTAVOS, COLUNAS_NFSE
+from formatacao import formatar_centavos, formatar_cpf_cnpj
+
+# Formatos de número usados na planilha
+FORMATO_MOEDA = 'R$ #,##0.00'
+FORMATO_NUMERO = '0.00'
+FORMATO_DATA = 'dd/mm/yyyy'
+
+# Colunas sem formatação percentual (valores numéricos simples)
+cols_numeric = ["pIBSUF", "pRedAliqUF", "pAliqEfetUF", "pRedAliqMun", "pCBS", "pRedAliqCBS", "pAliqEfetCBS"]
+
+# Valores monetários, guardados em centavos (int64) até a exibição ou exportação
+cols_to_format_currency = [
+    "Valor do Serviço", "ISS", "Base de Cálculo IBSCBS",
+    "vIBSUF", "vCBS"
+]
+
+def preparar_tabela(df):
+    # Excluir as colunas solicitadas (o prestador já aparece como emitente)
+    df = df.drop(columns=['pIBSMun', 'pAliqEfetMun', 'vIBSMun', 'CNPJ Prestador', 'Razão Social Prestador'], errors='ignore')
+    
+    if 'CPF/CNPJ Tomador' in df.columns:
+        df['CPF/CNPJ Tomador'] = formatar_cpf_cnpj(df['CPF/CNPJ Tomador'])
+    
+    all_numeric_cols = cols_numeric + cols_to_format_currency
+    for col in all_numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    
+    return df
+
+# Formato de número de cada coluna na planilha Excel
+formatos_excel = {col: FORMATO_MOEDA for col in cols_to_format_currency}
+formatos_excel.update({col: FORMATO_NUMERO for col in cols_numeric})
+formatos_excel["Data de Emissão"] = FORMATO_DATA
+
+# Formatos que já existem no Excel (não precisam ser declarados em numFmts)
+FORMATOS_EMBUTIDOS = {'0.00': 2}
+
+NS_PLANILHA = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_RELACOES = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+CONTENT_TYPES_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+RELS_XML = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="{NS_RELACOES}/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+WORKBOOK_RELS_XML = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="{NS_RELACOES}/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="{NS_RELACOES}/styles" Target="styles.xml"/>
+</Relationships>"""
+
+# Índices fixos em cellXfs; os formatos de coluna vêm a partir de ESTILO_PRIMEIRO_FORMATO
+ESTILO_CABECALHO = 1
+ESTILO_CENTRALIZADO = 2
+ESTILO_PRIMEIRO_FORMATO = 3
+
+def letra_coluna(indice):
+    # 0 -> A, 25 -> Z, 26 -> AA, 701 -> ZZ, 702 -> AAA
+    letras = ''
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(ord('A') + resto) + letras
+    return letras
+
+def escapar_xml(textos):
+    # Versão vetorizada de xml.sax.saxutils.escape, removendo também os
+    # caracteres de controle que não são permitidos em XML
+    return (textos.str.replace('&', '&amp;', regex=False)
+                  .str.replace('<', '&lt;', regex=False)
+                  .str.replace('>', '&gt;', regex=False)
+                  .str.replace(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', regex=True))
+
+def escapar_atributo(texto):
+    # Texto para um valor de atributo entre aspas duplas
+    return escape(texto, {'"': '&quot;'})
+
+# O Excel recusa nomes de planilha vazios, com mais de 31 caracteres, com
+# algum destes caracteres ou começando/terminando com apóstrofo
+CARACTERES_PROIBIDOS_PLANILHA = '[]:*?/\\'
+
+def validar_nome_planilha(nome):
+    if (not nome or len(nome) > 31 or any(caractere in CARACTERES_PROIBIDOS_PLANILHA for caractere in nome)
+            or nome.startswith("'") or nome.endswith("'")):
+        raise ValueError(
+            f'Nome de planilha inválido: {nome!r} (até 31 caracteres, sem {CARACTERES_PROIBIDOS_PLANILHA} '
+            'nem apóstrofo no início ou no fim)'
+        )
+
+def gerar_estilos(formatos):
+    # styles.xml com o cabeçalho azul, o alinhamento centralizado e um estilo
+    # por formato de número distinto (na ordem de `formatos`)
+    num_fmts = []
+    xfs_formatos = []
+    for formato in formatos:
+        num_fmt_id = FORMATOS_EMBUTIDOS.get(formato)
+        if num_fmt_id is None:
+            num_fmt_id = 164 + len(num_fmts)
+            num_fmts.append(f'<numFmt numFmtId="{num_fmt_id}" formatCode="{escapar_atributo(formato)}"/>')
+        xfs_formatos.append(
+            f'<xf numFmtId="{num_fmt_id}" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1" applyAlignment="1">'
+            '<alignment horizontal="center" vertical="center"/></xf>'
+        )
+
+    return f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="{NS_PLANILHA}">
+<numFmts count="{len(num_fmts)}">{''.join(num_fmts)}</numFmts>
+<fonts count="2">
+<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>
+<font><b/><sz val="11"/><color rgb="FFFFFFFF"/><name val="Calibri"/><family val="2"/></font>
+</fonts>
+<fills count="3">
+<fill><patternFill patternType="none"/></fill>
+<fill><patternFill patternType="gray125"/></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FF1F77B4"/><bgColor rgb="FF1F77B4"/></patternFill></fill>
+</fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="{ESTILO_PRIMEIRO_FORMATO + len(xfs_formatos)}">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1" applyAlignment="1"><alignment horizontal="center" vertical="center"/></xf>
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1"><alignment horizontal="center" vertical="center"/></xf>
+{''.join(xfs_formatos)}
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+def gerar_celulas(serie, letra, linhas, estilo, centavos=False):
+    # Uma string <c> por linha; valores ausentes viram células vazias. Uma
+    # coluna de centavos vai como o valor em reais, escrito de forma exata
+    referencia = '<c r="' + letra + linhas + f'" s="{estilo}"'
+    if centavos:
+        validos = pd.Series(True, index=serie.index)
+        celulas = referencia + '><v>' + texto_em_reais(serie) + '</v></c>'
+    elif pd.api.types.is_datetime64_dtype(serie.dtype):
+        # Datas vão como número de série do Excel (dias desde 30/12/1899)
+        validos = serie.notna()
+        dias = (serie - pd.Timestamp('1899-12-30')) / pd.Timedelta(days=1)
+        celulas = referencia + '><v>' + dias.astype(str) + '</v></c>'
+    elif pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        valores = serie.astype('float64')
+        validos = pd.Series(np.isfinite(valores.to_numpy()), index=serie.index)
+        celulas = referencia + '><v>' + valores.astype(str) + '</v></c>'
+    else:
+        validos = serie.notna()
+        celulas = referencia + ' t="inlineStr"><is><t xml:space="preserve">' + escapar_xml(serie.astype(str)) + '</t></is></c>'
+    return celulas.where(validos, '')
+
+def escrever_xlsx(df, destino, formatos=None, nome_planilha='Dados NFS-e', tamanho_bloco=10000, centavos=()):
+    # Grava a planilha em streaming: cada bloco de linhas é convertido em XML
+    # de forma vetorizada, coluna a coluna, e escrito direto no arquivo
+    # compactado, de modo que a memória usada não cresce com o número de linhas.
+    # A formatação (moeda, número, alinhamento) é definida uma vez por coluna.
+    # As colunas em `centavos` são gravadas como o valor em reais.
+    validar_nome_planilha(nome_planilha)
+    formatos = formatos or {}
+    em_centavos = [col in centavos for col in df.columns]
+    formatos_distintos = list(dict.fromkeys(formatos[col] for col in df.columns if col in formatos))
+    estilos = [
+        ESTILO_PRIMEIRO_FORMATO + formatos_distintos.index(formatos[col]) if col in formatos else ESTILO_CENTRALIZADO
+        for col in df.columns
+    ]
+    letras = [letra_coluna(indice) for indice in range(len(df.columns))]
+
+    # Largura de cada coluna pelo maior texto (cabeçalho incluído), limitada a
+    # 50; valores ausentes não contam (astype(str) os mantém como NaN), e numa
+    # coluna sem nenhum valor vale só o cabeçalho
+    larguras = []
+    for col, eh_centavos in zip(df.columns, em_centavos):
+        max_length = len(str(col))
+        if len(df):
+            textos = texto_em_reais(df[col]) if eh_centavos else df[col].astype(str)
+            maior_texto = textos.str.len().max()
+            if not pd.isna(maior_texto):
+                max_length = max(max_length, int(maior_texto))
+        larguras.append(min(max_length + 2, 50))
+
+    colunas_xml = ''.join(
+        f'<col min="{indice}" max="{indice}" width="{largura}" style="{estilo}" customWidth="1"/>'
+        for indice, (largura, estilo) in enumerate(zip(larguras, estilos), 1)
+    )
+    cabecalho = escapar_xml(pd.Series([str(col) for col in df.columns], dtype=object))
+    cabecalho_xml = ''.join(
+        f'<c r="{letra}1" s="{ESTILO_CABECALHO}" t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+        for letra, texto in zip(letras, cabecalho)
+    )
+    ultima_celula = f'{letras[-1] if letras else "A"}{len(df) + 1}'
+
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as pacote:
+        pacote.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        pacote.writestr('_rels/.rels', RELS_XML)
+        pacote.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS_XML)
+        pacote.writestr('xl/styles.xml', gerar_estilos(formatos_distintos))
+        pacote.writestr('xl/workbook.xml', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{NS_PLANILHA}" xmlns:r="{NS_RELACOES}"><sheets>'
+            f'<sheet name="{escapar_atributo(nome_planilha)}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+
+        with pacote.open('xl/worksheets/sheet1.xml', 'w') as planilha:
+            planilha.write((
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<worksheet xmlns="{NS_PLANILHA}"><dimension ref="A1:{ultima_celula}"/>'
+                f'<cols>{colunas_xml}</cols><sheetData><row r="1">{cabecalho_xml}</row>'
+            ).encode('utf-8'))
+
+            for inicio in range(0, len(df), tamanho_bloco):
+                bloco = df.iloc[inicio:inicio + tamanho_bloco]
+                linhas = pd.Series(np.arange(inicio + 2, inicio + 2 + len(bloco)), index=bloco.index).astype(str)
+                celulas = [
+                    gerar_celulas(bloco[col], letra, linhas, estilo, eh_centavos)
+                    for col, letra, estilo, eh_centavos in zip(bloco.columns, letras, estilos, em_centavos)
+                ]
+                linhas_xml = reduce(lambda a, b: a + b, celulas, '<row r="' + linhas + '">') + '</row>'
+                planilha.write(''.join(linhas_xml).encode('utf-8'))
+
+            planilha.write(b'</sheetData></worksheet>')
+
+def gerar_excel(df, formatos=None, centavos=()):
+    output = io.BytesIO()
+    escrever_xlsx(df, output, formatos, centavos=centavos)
+    return output.getvalue()
+
+def texto_em_reais(serie):
+    # Centavos (int64) como número decimal em reais: 123456 -> "1234.56"
+    return formatar_centavos(serie, prefixo='', milhar='', decimal='.')
+
+def centavos_para_decimal(serie):
+    # Centavos (int64) como decimal128(18, 2) do Arrow, com o mesmo valor exato
+    valores = pa.array(serie.to_numpy(dtype=np.int64)).cast(pa.decimal128(19, 0))
+    decimais = pc.multiply(valores, pa.scalar(Decimal('0.01'), pa.decimal128(3, 2))).cast(TIPOS_ARROW['centavos'])
+    return pd.Series(pd.arrays.ArrowExtensionArray(decimais), index=serie.index, name=serie.name)
+
+def decimal_para_centavos(coluna):
+    # Inverso de centavos_para_decimal, sobre uma coluna do Arrow
+    return pc.multiply(coluna, pa.scalar(Decimal(100), pa.decimal128(3, 0))).cast(pa.int64())
+
+def salvar_tabela(df, caminho):
+    # Formato escolhido pela extensão do arquivo de saída; os valores
+    # monetários saem em reais, exatos (texto decimal no CSV, decimal no Parquet)
+    extensao = os.path.splitext(caminho)[1].lower()
+    centavos = [col for col in cols_to_format_currency if col in df.columns]
+    if extensao == '.xlsx':
+        escrever_xlsx(df, caminho, formatos_excel, centavos=centavos)
+    elif extensao == '.csv':
+        df.assign(**{col: texto_em_reais(df[col]) for col in centavos}).to_csv(caminho, index=False)
+    elif extensao == '.parquet':
+        df.assign(**{col: centavos_para_decimal(df[col]) for col in centavos}).to_parquet(caminho, index=False)
+    else:
+        raise ValueError(f'Formato de saída não suportado: {extensao or caminho} (use .xlsx, .csv ou .parquet)')
+
+# Dataset Parquet particionado (hive): cnpj_prestador=.../competencia=AAAA-MM/
+# As chaves são sempre texto, para não perder zeros à esquerda do CNPJ.
+PARTICOES_DATASET = pa.schema([('cnpj_prestador', pa.string()), ('competencia', pa.string())])
+
+TIPOS_ARROW = {
+    'texto': pa.string(), 'categoria': pa.string(), 'float': pa.float64(),
+    'centavos': pa.decimal128(18, 2), 'data': pa.date32()
+}
+
+ESQUEMA_DATASET = pa.schema(
+    [(nome, TIPOS_ARROW[tipo]) for nome, tipo in COLUNAS_NFSE] + list(PARTICOES_DATASET)
+)
+
+def gravar_dataset(df, diretorio):
+    # Acrescenta as notas (DataFrame de extrair_dados_nfse) ao dataset: cada
+    # chamada grava arquivos novos nas partições, sem reescrever os anteriores.
+    dados = df.copy()
+    dados['cnpj_prestador'] = dados['CNPJ Prestador'].astype(str)
+    dados['competencia'] = dados['Data de Emissão'].dt.strftime('%Y-%m')
+    for nome, tipo in COLUNAS_NFSE:
+        if tipo == 'categoria':
+            dados[nome] = dados[nome].astype(object)
+        elif tipo == 'data':
+            dados[nome] = dados[nome].dt.date
+        elif tipo == 'centavos':
+            dados[nome] = centavos_para_decimal(dados[nome])
+
+    tabela = pa.Table.from_pandas(dados, schema=ESQUEMA_DATASET, preserve_index=False)
+    ds.write_dataset(
+        tabela,
+        diretorio,
+        format='parquet',
+        partitioning=ds.partitioning(PARTICOES_DATASET, flavor='hive'),
+        basename_template=f'parte-{uuid.uuid4().hex}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+def ler_dataset(diretorio, colunas=None, filtros=None):
+    # Lê só as colunas pedidas; os filtros (expressão do pyarrow ou lista no
+    # formato do pandas.read_parquet, ex. [('competencia', '=', '2025-03')])
+    # descartam partições e row groups antes da leitura. Os valores
+    # monetários voltam em centavos (int64), como em extrair_dados_nfse.
+    if isinstance(filtros, list):
+        filtros = pq.filters_to_expression(filtros)
+    dataset = ds.dataset(
+        diretorio,
+        schema=ESQUEMA_DATASET,
+        format='parquet',
+        partitioning=ds.partitioning(PARTICOES_DATASET, flavor='hive')
+    )
+    tabela = dataset.to_table(columns=colunas, filter=filtros)
+    for nome in COLUNAS_CENTAVOS:
+        if nome in tabela.column_names:
+            posicao = tabela.column_names.index(nome)
+            tabela = tabela.set_column(posicao, nome, decimal_para_centavos(tabela.column(nome)))
+    return tabela.to_pandas(date_as_object=False)
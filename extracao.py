@@ -0,0 +1,768 @@
+import numpy as np
+import pandas as pd
+import xml.etree.ElementTree as ET
+from array import array
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from contextlib import ExitStack, closing, nullcontext
+from functools import lru_cache
+import io
+import multiprocessing
+import os
+import time
+import zipfile
+
+from cache import calcular_digest
+from indice import Deduplicacao
+from metricas import medir_pico
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml é opcional
+    lxml_etree = None
+
+NAMESPACE_ABRASF = 'http://www.abrasf.org.br/nfse.xsd'
+NAMESPACE_NACIONAL = 'http://www.sped.fazenda.gov.br/nfse'
+
+# Plano de extração: campo -> caminho relativo ao InfNfse e valor padrão.
+# Cada caminho equivale a um nfse.find('.//ns:...'), mas todos são resolvidos
+# em uma única passada pela nota (ver extrair_campos).
+CAMPOS_NFSE = [
+    ('cnpj_prestador', 'Prestador/CpfCnpj/Cnpj', 'N/A'),
+    ('razao_social_prestador', 'Prestador/RazaoSocial', 'N/A'),
+    ('cpf_tomador', 'IdentificacaoTomador/CpfCnpj/Cpf', None),
+    ('cnpj_tomador', 'IdentificacaoTomador/CpfCnpj/Cnpj', None),
+    ('razao_social_tomador', 'Tomador/RazaoSocial', 'N/A'),
+    ('numero_nfse', 'Numero', 'N/A'),
+    ('valor_servicos', 'Servico/Valores/ValorServicos', '0'),
+    ('valor_iss', 'ValoresNfse/ValorIss', 'N/A'),
+    ('iss_retido', 'Servico/IssRetido', '2'),
+    ('data_emissao', 'DataEmissao', None),
+    ('item_lista_servico', 'Servico/ItemListaServico', 'N/A'),
+    ('codigo_nbs', 'Servico/CodigoNbs', 'N/A'),
+    ('codigo_cnae', 'Servico/CodigoCnae', 'N/A'),
+    ('vBC', 'IBSCBS/valores/vBC', '0'),
+    ('pIBSUF', 'IBSCBS/valores/uf/pIBSUF', '0'),
+    ('pRedAliqUF', 'IBSCBS/valores/uf/pRedAliqUF', '0'),
+    ('pAliqEfetUF', 'IBSCBS/valores/uf/pAliqEfetUF', '0'),
+    ('pRedAliqMun', 'IBSCBS/valores/mun/pRedAliqMun', '0'),
+    ('pCBS', 'IBSCBS/valores/fed/pCBS', '0'),
+    ('pRedAliqCBS', 'IBSCBS/valores/fed/pRedAliqCBS', '0'),
+    ('pAliqEfetCBS', 'IBSCBS/valores/fed/pAliqEfetCBS', '0'),
+    ('vIBSUF', 'IBSCBS/totCIBS/gIBS/gIBSUFTot/vIBSUF', '0'),
+    ('vCBS', 'IBSCBS/totCIBS/gCBS/vCBS', '0'),
+    ('discriminacao', 'Servico/Discriminacao', 'N/A'),
+]
+
+# Mesmos campos no leiaute nacional (NFSe/infNFSe, com a DPS dentro). Não há
+# CNAE na DPS, e o item da lista de serviços é o código de tributação
+# nacional (cTribNac). A retenção vem de tpRetISSQN (ver valores_nota).
+CAMPOS_NFSE_NACIONAL = [
+    ('cnpj_prestador', 'emit/CNPJ', 'N/A'),
+    ('razao_social_prestador', 'emit/xNome', 'N/A'),
+    ('cpf_tomador', 'toma/CPF', None),
+    ('cnpj_tomador', 'toma/CNPJ', None),
+    ('razao_social_tomador', 'toma/xNome', 'N/A'),
+    ('numero_nfse', 'nNFSe', 'N/A'),
+    ('valor_servicos', 'valores/vServPrest/vServ', '0'),
+    ('valor_iss', 'valores/vISSQN', 'N/A'),
+    ('tp_ret_issqn', 'tribMun/tpRetISSQN', None),
+    ('data_emissao', 'infDPS/dhEmi', None),
+    ('item_lista_servico', 'cServ/cTribNac', 'N/A'),
+    ('codigo_nbs', 'cServ/cNBS', 'N/A'),
+    ('vBC', 'IBSCBS/valores/vBC', '0'),
+    ('pIBSUF', 'IBSCBS/valores/uf/pIBSUF', '0'),
+    ('pRedAliqUF', 'IBSCBS/valores/uf/pRedAliqUF', '0'),
+    ('pAliqEfetUF', 'IBSCBS/valores/uf/pAliqEfetUF', '0'),
+    ('pRedAliqMun', 'IBSCBS/valores/mun/pRedAliqMun', '0'),
+    ('pCBS', 'IBSCBS/valores/fed/pCBS', '0'),
+    ('pRedAliqCBS', 'IBSCBS/valores/fed/pRedAliqCBS', '0'),
+    ('pAliqEfetCBS', 'IBSCBS/valores/fed/pAliqEfetCBS', '0'),
+    ('vIBSUF', 'IBSCBS/totCIBS/gIBS/gIBSUFTot/vIBSUF', '0'),
+    ('vCBS', 'IBSCBS/totCIBS/gCBS/vCBS', '0'),
+    ('discriminacao', 'cServ/xDescServ', 'N/A'),
+]
+
+# Leiautes reconhecidos: nome -> (elemento de cada nota, campos). O namespace
+# vem do próprio arquivo (leiaute_da_tag), então o leiaute ABRASF também
+# cobre os municípios que usam os mesmos elementos em outro namespace ou sem
+# namespace.
+LEIAUTES = {
+    'abrasf': ('InfNfse', CAMPOS_NFSE),
+    'nacional': ('infNFSe', CAMPOS_NFSE_NACIONAL),
+}
+
+LEIAUTES_POR_ELEMENTO = {elemento: nome for nome, (elemento, _) in LEIAUTES.items()}
+
+# Elementos de nota de qualquer leiaute, em qualquer namespace (filtro do lxml)
+TAGS_NOTA = ['{*}' + elemento for elemento in LEIAUTES_POR_ELEMENTO]
+
+# Leitores de XML: 'etree' (xml.etree.ElementTree, sempre disponível, o
+# padrão) e 'lxml', opcional. Os dois geram as mesmas notas
+# (tests/test_backends.py); o lxml ganha pouco nos lotes grandes e é mais
+# lento nos arquivos de uma nota (benchmarks/bench_backends.py).
+BACKENDS = ('etree', 'lxml')
+BACKEND_PADRAO = 'etree'
+
+# Arquivos maiores que isso são lidos em streaming (iterar_infnfse); os demais,
+# com a árvore inteira, que ocupa poucas vezes o tamanho do arquivo
+LIMITE_PARSE_COMPLETO = 1024 * 1024
+
+VALORES_PADRAO = {campo: padrao for _, campos in LEIAUTES.values() for campo, _, padrao in campos}
+
+# Colunas do DataFrame, na ordem de exibição, e o tipo de cada uma:
+# 'texto' (str), 'float' (float64), 'centavos' (int64 com o valor monetário
+# em centavos, exato), 'categoria' (category) e 'data' (datetime64)
+COLUNAS_NFSE = [
+    ("CPF/CNPJ Tomador", 'texto'),
+    ("Razão Social Tomador", 'texto'),
+    ("Número NFS-e", 'texto'),
+    ("Valor do Serviço", 'centavos'),
+    ("Alíquota", 'categoria'),
+    ("ISS", 'centavos'),
+    ("ISS Retido", 'categoria'),
+    ("Data de Emissão", 'data'),
+    ("Item", 'categoria'),
+    ("Código NBS", 'categoria'),
+    ("Código CNAE", 'categoria'),
+    ("Base de Cálculo IBSCBS", 'centavos'),
+    ("pIBSUF", 'float'),
+    ("pRedAliqUF", 'float'),
+    ("pAliqEfetUF", 'float'),
+    ("pRedAliqMun", 'float'),
+    ("pCBS", 'float'),
+    ("pRedAliqCBS", 'float'),
+    ("pAliqEfetCBS", 'float'),
+    ("vIBSUF", 'centavos'),
+    ("vCBS", 'centavos'),
+    ("Descrição do Serviço", 'texto'),
+    # Prestador de cada nota (um ZIP pode ter notas de mais de um emitente)
+    ("CNPJ Prestador", 'categoria'),
+    ("Razão Social Prestador", 'categoria'),
+]
+
+NOMES_COLUNAS = [nome for nome, _ in COLUNAS_NFSE]
+
+COLUNAS_CENTAVOS = [nome for nome, tipo in COLUNAS_NFSE if tipo == 'centavos']
+
+# Colunas das linhas de processar_xml (ColetorNotas.registros): as de sempre,
+# sem o prestador de cada nota
+COLUNAS_REGISTROS = [(nome, tipo) for nome, tipo in COLUNAS_NFSE if nome not in ('CNPJ Prestador', 'Razão Social Prestador')]
+
+def qualificar(namespace, nome):
+    return '{%s}%s' % (namespace, nome) if namespace else nome
+
+@lru_cache(maxsize=None)
+def compilar_plano(namespace, leiaute='abrasf'):
+    # Tabela de despacho indexada pela tag do último elemento do caminho:
+    # {tag: [(caminho qualificado, campo), ...]}, uma por leiaute e namespace
+    plano = {}
+    for campo, caminho, _ in LEIAUTES[leiaute][1]:
+        tags = [qualificar(namespace, parte) for parte in caminho.split('/')]
+        plano.setdefault(tags[-1], []).append((tags, campo))
+    return plano
+
+@lru_cache(maxsize=1024)
+def leiaute_da_tag(tag):
+    # (leiaute, namespace) se a tag for de um elemento de nota (InfNfse ou
+    # infNFSe, em qualquer namespace ou sem namespace); senão, None. O primeiro
+    # elemento de nota que o leitor encontra define o leiaute do arquivo.
+    namespace, _, nome = tag[1:].rpartition('}') if tag[0] == '{' else ('', '', tag)
+    leiaute = LEIAUTES_POR_ELEMENTO.get(nome)
+    return (leiaute, namespace) if leiaute else None
+
+def plano_da_tag(tag_nota):
+    # Plano (compilar_plano) das notas com a tag tag_nota
+    leiaute, namespace = leiaute_da_tag(tag_nota)
+    return compilar_plano(namespace, leiaute)
+
+def extrair_campos(nfse, plano):
+    # Percorre a nota uma única vez em ordem de documento; o primeiro elemento
+    # cujo caminho termina no caminho do campo define o valor, como no find().
+    valores = {}
+    caminho = []
+
+    def percorrer(elem):
+        for filho in elem:
+            caminho.append(filho.tag)
+            regras = plano.get(filho.tag)
+            if regras:
+                for tags, campo in regras:
+                    if campo not in valores and caminho[-len(tags):] == tags:
+                        valores[campo] = filho.text
+            if len(filho):
+                percorrer(filho)
+            caminho.pop()
+
+    percorrer(nfse)
+    return valores
+
+def tamanho_xml(xml_content):
+    # Bytes de um arquivo (objeto com read/seek ou caminho) a partir da posição atual
+    if hasattr(xml_content, 'read'):
+        posicao = xml_content.tell()
+        tamanho = xml_content.seek(0, io.SEEK_END) - posicao
+        xml_content.seek(posicao)
+        return tamanho
+    return os.path.getsize(xml_content)
+
+def iterar_infnfse(xml_content):
+    # Notas do XML, na ordem em que fecham: os elementos com a tag do primeiro
+    # elemento de nota do arquivo (InfNfse ou infNFSe, leiaute_da_tag). Arquivos de até LIMITE_PARSE_COMPLETO bytes (o caso comum,
+    # uma nota ou um lote pequeno por arquivo) são lidos de uma vez, o que
+    # custa cerca de metade do streaming por arquivo; os maiores passam por
+    # iterar_infnfse_streaming, com a memória limitada.
+    if tamanho_xml(xml_content) > LIMITE_PARSE_COMPLETO:
+        yield from iterar_infnfse_streaming(xml_content)
+        return
+
+    posicao = xml_content.tell() if hasattr(xml_content, 'read') else None
+    raiz = ET.parse(xml_content).getroot()
+    tag_infnfse = next((elem.tag for elem in raiz.iter() if leiaute_da_tag(elem.tag)), None)
+    if tag_infnfse is None:
+        return
+    # O elemento raiz não é considerado, assim como em findall('.//ns:InfNfse')
+    notas = [nfse for nfse in raiz.iter(tag_infnfse) if nfse is not raiz]
+    if sum(1 for nfse in notas for _ in nfse.iter(tag_infnfse)) == len(notas):
+        yield from notas
+        return
+
+    # Notas dentro de notas: o streaming as entrega antes da nota externa, já
+    # limpas, e a árvore completa não reproduz isso sem percorrer cada elemento
+    if posicao is not None:
+        xml_content.seek(posicao)
+    yield from iterar_infnfse_streaming(xml_content)
+
+def iterar_infnfse_streaming(xml_content):
+    # Percorre o XML em streaming, entregando cada nota (as mesmas de
+    # iterar_infnfse, com a tag do primeiro elemento de nota aberto) assim que
+    # ela fecha. Depois de consumido, o elemento
+    # é limpo e os nós já fechados fora de uma nota são removidos do pai,
+    # mantendo a memória limitada mesmo em lotes grandes.
+    pilha = []
+    tag_infnfse = None
+    dentro_infnfse = 0
+
+    for evento, elem in ET.iterparse(xml_content, events=('start', 'end')):
+        if evento == 'start':
+            pilha.append(elem)
+            if tag_infnfse is None and leiaute_da_tag(elem.tag):
+                tag_infnfse = elem.tag
+            if elem.tag == tag_infnfse:
+                dentro_infnfse += 1
+            continue
+
+        pilha.pop()
+        if elem.tag == tag_infnfse:
+            dentro_infnfse -= 1
+            # O elemento raiz não é considerado, assim como em findall('.//ns:InfNfse')
+            if pilha:
+                yield elem
+            elem.clear()
+        if pilha and not dentro_infnfse:
+            pilha[-1].remove(elem)
+
+def campos_etree(xml_content):
+    # Campos (extrair_campos) de cada nota, com o ElementTree
+    plano = None
+    for nfse in iterar_infnfse(xml_content):
+        if plano is None:
+            plano = plano_da_tag(nfse.tag)
+        yield extrair_campos(nfse, plano)
+
+def campos_lxml(xml_content):
+    # Mesmos campos de campos_etree, com o lxml: o parser e a busca, em cada
+    # nota, dos elementos cuja tag está no plano (nfse.iter) rodam em C, e só
+    # esses elementos viram objetos Python. O filtro TAGS_NOTA só entrega
+    # elementos de nota, e o primeiro que abre define a tag das notas. Sem
+    # comentários e instruções de processamento, o texto de cada elemento é o
+    # mesmo do etree (<Numero>1<!--c-->2</Numero> dá '12'). Como em
+    # iterar_infnfse, a nota raiz é ignorada e cada nota lida é limpa; fora de
+    # outra nota, os nós anteriores a ela também são removidos (dentro, a nota
+    # externa ainda será lida). Um XML inválido levanta ET.ParseError, como no etree.
+    tag_nota = None
+    abertas = 0
+    try:
+        for evento, nfse in lxml_etree.iterparse(xml_content, events=('start', 'end'), tag=TAGS_NOTA, remove_comments=True, remove_pis=True):
+            if tag_nota is None:
+                tag_nota = nfse.tag
+                plano = plano_da_tag(tag_nota)
+                tags_plano = list(plano)
+            if nfse.tag != tag_nota:
+                continue
+            if evento == 'start':
+                abertas += 1
+                continue
+            abertas -= 1
+            if nfse.getparent() is None:
+                continue
+            valores = {}
+            for elem in nfse.iter(tags_plano):
+                for tags, campo in plano[elem.tag]:
+                    if campo not in valores and caminho_termina_em(elem, tags, nfse):
+                        valores[campo] = elem.text
+            yield valores
+            nfse.clear()
+            if abertas:
+                continue
+            for ancestral in nfse.iterancestors():
+                while ancestral.getprevious() is not None:
+                    del ancestral.getparent()[0]
+            while nfse.getprevious() is not None:
+                del nfse.getparent()[0]
+    except lxml_etree.XMLSyntaxError as erro:
+        raise ET.ParseError(str(erro)) from erro
+
+def caminho_termina_em(elem, tags, nfse):
+    # Se elem e seus ancestrais dentro de nfse terminam no caminho `tags`
+    for tag in reversed(tags[:-1]):
+        elem = elem.getparent()
+        if elem is nfse or elem.tag != tag:
+            return False
+    return True
+
+class ColetorNotas:
+    # Acumula as notas coluna a coluna, sem um dict por nota: floats em
+    # array('d'), centavos em array('q'), colunas categóricas como códigos em
+    # array('i') mais o dicionário de categorias, e textos em listas.
+    # para_dataframe() monta o DataFrame já com os tipos de COLUNAS_NFSE.
+
+    def __init__(self):
+        self.colunas = {}
+        self.categorias = {}
+        for nome, tipo in COLUNAS_NFSE:
+            if tipo == 'float':
+                self.colunas[nome] = array('d')
+            elif tipo == 'centavos':
+                self.colunas[nome] = array('q')
+            elif tipo == 'categoria':
+                self.colunas[nome] = array('i')
+                self.categorias[nome] = {}
+            else:
+                self.colunas[nome] = []
+        self._listas = [(self.colunas[nome], self.categorias.get(nome)) for nome in NOMES_COLUNAS]
+
+    def __len__(self):
+        return len(self.colunas[NOMES_COLUNAS[0]])
+
+    def __sizeof__(self):
+        tamanho = object.__sizeof__(self)
+        for nome, tipo in COLUNAS_NFSE:
+            coluna = self.colunas[nome]
+            tamanho += coluna.__sizeof__()
+            if tipo in ('texto', 'data'):
+                tamanho += sum(len(valor) + 49 for valor in coluna if valor is not None)
+        return tamanho
+
+    def adicionar(self, valores):
+        # valores na ordem de NOMES_COLUNAS (ver valores_nota)
+        for (coluna, categorias), valor in zip(self._listas, valores):
+            if categorias is None:
+                coluna.append(valor)
+            elif valor is None:
+                coluna.append(-1)
+            else:
+                codigo = categorias.get(valor)
+                if codigo is None:
+                    codigo = categorias[valor] = len(categorias)
+                coluna.append(codigo)
+
+    def truncar(self, tamanho):
+        # Descarta as notas a partir da posição `tamanho` (XML inválido no meio)
+        # e as categorias que só apareceram nelas: os códigos são dados em ordem
+        # de aparição, então as que ficam são as até o maior código restante
+        for nome, coluna in self.colunas.items():
+            del coluna[tamanho:]
+            categorias = self.categorias.get(nome)
+            if categorias:
+                for valor in list(categorias)[max(coluna, default=-1) + 1:]:
+                    del categorias[valor]
+
+    def estender(self, outro):
+        for nome in NOMES_COLUNAS:
+            categorias = self.categorias.get(nome)
+            if categorias is None:
+                self.colunas[nome].extend(outro.colunas[nome])
+                continue
+            # Recodifica as categorias do outro coletor para os códigos deste
+            mapa = {-1: -1}
+            for valor, codigo in outro.categorias[nome].items():
+                mapa[codigo] = categorias.setdefault(valor, len(categorias))
+            self.colunas[nome].extend(mapa[codigo] for codigo in outro.colunas[nome])
+
+    def registros(self):
+        # Mesmos dicts por nota que processar_xml sempre devolveu: as colunas
+        # de COLUNAS_REGISTROS, valores em reais (float) e a data de emissão
+        # como DD/MM/AAAA ('N/A' se ausente ou inválida, como no DataFrame)
+        colunas = []
+        for nome, tipo in COLUNAS_REGISTROS:
+            coluna = self.colunas[nome]
+            if tipo == 'centavos':
+                coluna = [valor / 100 for valor in coluna]
+            elif tipo == 'categoria':
+                valores = list(self.categorias[nome])
+                coluna = [valores[codigo] if codigo >= 0 else None for codigo in coluna]
+            elif tipo == 'data':
+                coluna = converter_datas_emissao(coluna).dt.strftime('%d/%m/%Y').fillna('N/A').tolist()
+            colunas.append(coluna)
+        return [dict(zip([nome for nome, _ in COLUNAS_REGISTROS], linha)) for linha in zip(*colunas)]
+
+    def para_dataframe(self):
+        dados = {}
+        for nome, tipo in COLUNAS_NFSE:
+            coluna = self.colunas[nome]
+            if tipo == 'float':
+                dados[nome] = np.array(coluna, dtype=np.float64)
+            elif tipo == 'centavos':
+                dados[nome] = np.array(coluna, dtype=np.int64)
+            elif tipo == 'categoria':
+                dados[nome] = pd.Categorical.from_codes(
+                    np.array(coluna, dtype=np.int32), categories=list(self.categorias[nome])
+                )
+            elif tipo == 'data':
+                dados[nome] = converter_datas_emissao(coluna)
+            else:
+                dados[nome] = pd.Series(coluna, dtype='str')
+        return pd.DataFrame(dados)
+
+def converter_datas_emissao(textos):
+    # Textos de DataEmissao -> datetime64, para o DataFrame e para registros().
+    # Só a data (AAAA-MM-DD) interessa; valores ausentes ou inválidos viram NaT
+    textos = pd.Series(textos, dtype=object).str.slice(0, 10)
+    return pd.to_datetime(textos, format='%Y-%m-%d', errors='coerce')
+
+class ExtracaoCancelada(Exception):
+    # Levantada pela extração quando o evento `cancelar` é acionado
+    pass
+
+def extrair_dados_nfse(xml_file, workers=1, tamanho_lote=64, cache=None, indice=None, metricas=None, backend=None, progresso=None, cancelar=None, pool=None):
+    # workers > 1 distribui os XMLs de um ZIP entre processos, em lotes de
+    # tamanho_lote arquivos; a ordem das linhas é a mesma do modo sequencial.
+    # Com um cache (cache.CacheLRU), XMLs já processados não são lidos de novo.
+    # Arquivos repetidos (mesmo conteúdo) e notas repetidas (mesmo prestador e
+    # número) são ignorados; com um índice (indice.IndiceNotas), também os já
+    # processados em extrações anteriores. O resumo fica em df.attrs['deduplicacao'].
+    # Com metricas (metricas.MetricasExtracao), tempo, bytes, notas e erros de
+    # cada etapa e de cada XML ficam registrados nele. backend escolhe o
+    # leitor de XML (BACKENDS); por padrão, BACKEND_PADRAO.
+    # progresso(concluidos, total, notas) é chamado a cada XML concluído, com
+    # as notas (ColetorNotas) dele; com cancelar (threading.Event), a extração
+    # para no próximo XML lido ou concluído depois que o evento é acionado,
+    # levantando ExtracaoCancelada. pool (criar_pool) é um pool de processos
+    # reaproveitado entre extrações; sem ele, a extração paralela cria o seu.
+    return extrair_dados_uploads([xml_file], workers, tamanho_lote, cache, indice, metricas, backend, progresso, cancelar, pool)
+
+def extrair_dados_uploads(arquivos, workers=1, tamanho_lote=64, cache=None, indice=None, metricas=None, backend=None, progresso=None, cancelar=None, pool=None):
+    # Vários arquivos XML/ZIP enviados de uma vez (objetos com .name e .read()).
+    # Os XMLs de todos eles formam um único fluxo para processar_membros, que
+    # os distribui entre os mesmos processos; as linhas seguem a ordem dos
+    # arquivos. Cada linha traz o CNPJ e a razão social do próprio prestador.
+    with ExitStack() as pilha:
+        membros = listar_membros(((arquivo.name, arquivo) for arquivo in arquivos), ler_upload, pilha, metricas)
+        return extrair_membros(membros, workers, tamanho_lote, cache, indice, metricas, backend, progresso, cancelar, pool)
+
+def extrair_dados_arquivos(caminhos, workers=1, tamanho_lote=64, cache=None, indice=None, metricas=None, backend=None, progresso=None, cancelar=None, pool=None):
+    # Equivalente a extrair_dados_uploads para arquivos em disco (usado pela CLI)
+    with ExitStack() as pilha:
+        membros = listar_membros(((caminho, caminho) for caminho in caminhos), ler_caminho, pilha, metricas)
+        return extrair_membros(membros, workers, tamanho_lote, cache, indice, metricas, backend, progresso, cancelar, pool)
+
+def listar_membros(fontes, ler_avulso, pilha, metricas=None):
+    # fontes: pares (nome, arquivo ou caminho). Devolve trios (ler, fonte,
+    # rótulo) para cada XML, com ler(fonte) devolvendo o conteúdo: os de um ZIP
+    # são lidos do ZipFile (aberto na pilha) e os XMLs avulsos por ler_avulso.
+    # Um ZIP que não pode ser aberto entra nas métricas como arquivo com erro.
+    membros = []
+    for nome, fonte in fontes:
+        if nome.endswith('.zip'):
+            try:
+                zip_ref = pilha.enter_context(zipfile.ZipFile(fonte, 'r'))
+            except zipfile.BadZipFile as erro:
+                if metricas is None:
+                    raise
+                metricas.registrar_arquivo(nome, 0, 0, 0.0, f'ZIP inválido: {erro}')
+                continue
+            membros.extend((zip_ref.read, membro, f'{nome}/{membro}') for membro in zip_ref.namelist() if membro.endswith('.xml'))
+        elif nome.endswith('.xml'):
+            membros.append((ler_avulso, fonte, nome))
+    return membros
+
+def ler_upload(arquivo):
+    arquivo.seek(0)
+    return arquivo.read()
+
+def ler_caminho(caminho):
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
+
+def extrair_membros(membros, workers=1, tamanho_lote=64, cache=None, indice=None, metricas=None, backend=None, progresso=None, cancelar=None, pool=None):
+    # membros: trios (ler, fonte, rótulo) de listar_membros.
+    # O emitente devolvido é o do primeiro arquivo que tiver um. Os arquivos
+    # ignorados (repetidos ou já no índice) também contam como concluídos no progresso.
+    coletor = ColetorNotas()
+    deduplicacao = Deduplicacao(indice)
+    emitente_info = None
+    ignorados = 0
+
+    def ignorar(digest):
+        nonlocal ignorados
+        ignorado = deduplicacao.ignorar_arquivo(digest)
+        ignorados += ignorado
+        return ignorado
+
+    with etapa(metricas, 'extracao') as registro:
+        resultados = processar_membros(
+            lambda membro: membro[0](membro[1]), membros, workers, tamanho_lote, cache, ignorar, metricas, descrever=lambda membro: membro[2], backend=backend, cancelar=cancelar, pool=pool
+        )
+        # closing: ao cancelar, o pool de processos é encerrado na hora
+        with closing(resultados):
+            for concluidos, (digest, notas, emitente, erro) in enumerate(resultados, 1):
+                coletor.estender(notas)
+                deduplicacao.registrar_origem(digest, len(notas), erro)
+                if emitente and not emitente_info:
+                    emitente_info = emitente
+                if progresso is not None:
+                    progresso(concluidos + ignorados, len(membros), notas)
+                if cancelar is not None and cancelar.is_set():
+                    raise ExtracaoCancelada(f'{concluidos + ignorados} de {len(membros)} arquivos concluídos')
+        registro['notas'] = len(coletor)
+        if metricas is not None:
+            registro['bytes'] = sum(arquivo['bytes'] for arquivo in metricas.arquivos)
+            if metricas.medir_memoria:
+                # Maior pico de um arquivo, medido no processo que o leu
+                registro['pico_arquivo_max_mb'] = max(
+                    (arquivo['pico_mb'] for arquivo in metricas.arquivos if arquivo['pico_mb'] is not None), default=None
+                )
+
+    with etapa(metricas, 'dataframe', notas=len(coletor)):
+        df = coletor.para_dataframe()
+    with etapa(metricas, 'deduplicacao') as registro:
+        df = deduplicacao.filtrar(df)
+        deduplicacao.confirmar(df)
+        df.attrs['deduplicacao'] = deduplicacao.resumo()
+        registro['notas'] = len(df)
+    if metricas is not None:
+        metricas.concluir()
+    return df, emitente_info
+
+def etapa(metricas, nome, **dados):
+    # metricas.etapa(...) ou, sem métricas, um bloco que só recebe o registro
+    return metricas.etapa(nome, **dados) if metricas is not None else nullcontext(dict(dados))
+
+def processar_membro(conteudo, backend=None, medir_memoria=False):
+    # (ColetorNotas, emitente, erro, segundos, pico_mb) de um XML; se ele for
+    # inválido ou tiver um valor que não pode ser lido (número vazio ou fora
+    # do formato), o coletor fica vazio e erro descreve o problema. Com
+    # medir_memoria, pico_mb é o pico de alocações da leitura (senão, None).
+    inicio = time.perf_counter()
+    coletor = ColetorNotas()
+    emitente = None
+    erro = None
+    with medir_pico() if medir_memoria else nullcontext({}) as memoria:
+        try:
+            emitente = ler_notas(io.BytesIO(conteudo), coletor, backend)
+        except ET.ParseError as excecao:
+            erro = f'XML inválido: {excecao}'
+        except (ValueError, TypeError) as excecao:
+            erro = f'Valor inválido: {excecao}'
+    if erro:
+        coletor.truncar(0)
+    return coletor, emitente, erro, time.perf_counter() - inicio, memoria.get('pico_mb')
+
+def processar_lote(conteudos, backend=None, medir_memoria=False):
+    # Executado nos processos do pool: processar_membro de cada arquivo. Com
+    # medir_memoria, o tracemalloc do processo fica ligado durante o lote todo.
+    with medir_pico() if medir_memoria else nullcontext():
+        return [processar_membro(conteudo, backend, medir_memoria) for conteudo in conteudos]
+
+def criar_pool(workers):
+    # Pool de processos da extração paralela; os processos são iniciados
+    # (spawn) à medida que os lotes chegam e ficam abertos até shutdown()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+def processar_membros(ler, xml_filenames, workers=1, tamanho_lote=64, cache=None, ignorar=None, metricas=None, descrever=str, backend=None, cancelar=None, pool=None):
+    # Devolve (digest, ColetorNotas, emitente, erro) por arquivo, na ordem de
+    # xml_filenames; ler(nome) devolve o conteúdo do arquivo (zip_ref.read, por
+    # exemplo) e arquivos para os quais ignorar(digest) é verdadeiro são pulados.
+    # Os membros que não estão no cache são processados em lotes; em paralelo,
+    # no máximo 2 lotes por processo ficam em andamento, para não descompactar
+    # o ZIP inteiro na memória de uma vez. Com metricas, cada arquivo é
+    # registrado com o rótulo descrever(nome), seus bytes, notas, tempo e erro.
+    # Com cancelar acionado, a espera por um lote levanta ExtracaoCancelada e
+    # o pool é encerrado sem esperar os lotes que já estão nos processos. Com
+    # um pool compartilhado (pool), ele continua aberto e só os lotes desta
+    # extração que ainda não começaram são cancelados.
+    paralelo = workers > 1 and len(xml_filenames) > tamanho_lote
+    medir_memoria = metricas is not None and metricas.medir_memoria
+    pool_proprio = paralelo and pool is None
+    executor = (pool or criar_pool(workers)) if paralelo else None
+    limite_pendentes = workers * 2 if paralelo else 0
+
+    pendentes = deque()  # (membros, Future ou lista de resultados), membro = (nome, digest, bytes)
+    lote = []
+    membros_lote = []
+
+    def enviar():
+        if executor:
+            pendentes.append((membros_lote[:], executor.submit(processar_lote, lote[:], backend, medir_memoria)))
+        else:
+            pendentes.append((membros_lote[:], processar_lote(lote, backend, medir_memoria)))
+        lote.clear()
+        membros_lote.clear()
+
+    def verificar_cancelamento():
+        if cancelar is not None and cancelar.is_set():
+            raise ExtracaoCancelada('extração cancelada')
+
+    def aguardar(futuro):
+        while cancelar is not None and not futuro.done():
+            verificar_cancelamento()
+            wait([futuro], timeout=0.1)
+        return futuro.result()
+
+    def concluir():
+        membros, resultados = pendentes.popleft()
+        if executor:
+            resultados = aguardar(resultados)
+        for (nome, digest, tamanho), (coletor, emitente, erro, segundos, pico_mb) in zip(membros, resultados):
+            if cache is not None and segundos is not None:
+                cache.guardar(('xml', digest), (coletor, emitente, erro))
+            if metricas is not None:
+                metricas.registrar_arquivo(
+                    descrever(nome), tamanho, len(coletor), segundos or 0.0, erro, em_cache=segundos is None, pico_mb=pico_mb
+                )
+            yield digest, coletor, emitente, erro
+
+    try:
+        for nome in xml_filenames:
+            verificar_cancelamento()
+            conteudo = ler(nome)
+            digest = calcular_digest(conteudo)
+            if ignorar is not None and ignorar(digest):
+                continue
+            resultado = cache.obter(('xml', digest)) if cache is not None else None
+            if resultado is not None:
+                if lote:
+                    enviar()
+                # Resultado do cache: sem tempo de processamento nem memória
+                pendentes.append(([(nome, digest, len(conteudo))], [resultado + (None, None)]))
+            else:
+                lote.append(conteudo)
+                membros_lote.append((nome, digest, len(conteudo)))
+                if len(lote) >= tamanho_lote:
+                    enviar()
+            while len(pendentes) > limite_pendentes:
+                yield from concluir()
+        if lote:
+            enviar()
+        while pendentes:
+            yield from concluir()
+    finally:
+        if pool_proprio:
+            executor.shutdown(wait=cancelar is None or not cancelar.is_set(), cancel_futures=True)
+        elif executor:
+            for _, resultados in pendentes:
+                if isinstance(resultados, Future):
+                    resultados.cancel()
+
+def processar_xml(xml_content, backend=None):
+    coletor = ColetorNotas()
+    emitente_info = ler_xml(xml_content, coletor, backend)
+    return coletor.registros(), emitente_info
+
+def ler_xml(xml_content, coletor, backend=None):
+    # Acrescenta as notas do XML ao coletor e devolve o emitente da primeira.
+    # Se o XML for inválido (ou tiver um valor ilegível), nenhuma nota dele é mantida.
+    inicio = len(coletor)
+    try:
+        return ler_notas(xml_content, coletor, backend)
+    except (ET.ParseError, ValueError, TypeError):
+        coletor.truncar(inicio)
+        return None
+
+def ler_notas(xml_content, coletor, backend=None):
+    # Como ler_xml, mas um XML inválido levanta ET.ParseError e um valor
+    # ilegível, ValueError ou TypeError (as notas lidas antes do erro ficam no
+    # coletor). O leiaute e o namespace vêm do primeiro elemento de nota, na
+    # mesma leitura do arquivo.
+    ler_campos = campos_lxml if (backend or BACKEND_PADRAO) == 'lxml' else campos_etree
+    emitente_info = None
+
+    for campos in ler_campos(xml_content):
+        coletor.adicionar(valores_nota(campos))
+        if not emitente_info:
+            emitente_info = emitente_nota(campos)
+
+    return emitente_info
+
+def emitente_nota(campos):
+    cnpj, razao_social = prestador_nota(campos)
+    return {'cnpj': cnpj, 'razao_social': razao_social}
+
+def prestador_nota(campos):
+    # CNPJ e razão social do prestador; um elemento vazio (<Cnpj></Cnpj>, texto
+    # None) também vira 'N/A', para a nota não ficar fora dos totais por prestador
+    return (
+        campos.get('cnpj_prestador') or VALORES_PADRAO['cnpj_prestador'],
+        campos.get('razao_social_prestador') or VALORES_PADRAO['razao_social_prestador'],
+    )
+
+def valores_nota(campos):
+    # Valores de uma nota na ordem de NOMES_COLUNAS; a data de emissão vai como
+    # o texto do XML e é convertida depois, de uma vez, pelo ColetorNotas
+    def valor(campo):
+        return campos.get(campo, VALORES_PADRAO[campo])
+
+    # Dados do Tomador (CPF ou CNPJ)
+    cpf_cnpj_valor = campos['cpf_tomador'] if 'cpf_tomador' in campos else campos['cnpj_tomador'] if 'cnpj_tomador' in campos else 'N/A'
+
+    # IssRetido (ABRASF): 1 = retido. tpRetISSQN (nacional): 1 = não retido,
+    # 2 = retido pelo tomador e 3 = retido pelo intermediário
+    if 'tp_ret_issqn' in campos:
+        iss_retido_texto = "Sim" if campos['tp_ret_issqn'] in ('2', '3') else "Não"
+    else:
+        iss_retido_texto = "Sim" if valor('iss_retido') == "1" else "Não"
+
+    valor_iss = valor('valor_iss')
+
+    return (
+        cpf_cnpj_valor,
+        valor('razao_social_tomador'),
+        valor('numero_nfse'),
+        centavos(valor('valor_servicos')),
+        "3%",
+        centavos(valor_iss) if valor_iss != 'N/A' else 0,
+        iss_retido_texto,
+        valor('data_emissao'),
+        valor('item_lista_servico'),
+        valor('codigo_nbs'),
+        valor('codigo_cnae'),
+        centavos(valor('vBC')),
+        float(valor('pIBSUF')),
+        float(valor('pRedAliqUF')),
+        float(valor('pAliqEfetUF')),
+        float(valor('pRedAliqMun')),
+        float(valor('pCBS')),
+        float(valor('pRedAliqCBS')),
+        float(valor('pAliqEfetCBS')),
+        centavos(valor('vIBSUF')),
+        centavos(valor('vCBS')),
+        valor('discriminacao'),
+        *prestador_nota(campos),
+    )
+
+def centavos(texto):
+    # Valor monetário do XML em centavos, lido do texto sem passar por float
+    # ("1234.5" -> 123450). Com mais de duas casas decimais, o meio centavo é
+    # arredondado para longe do zero; elemento vazio (None) ou texto que não é
+    # número levanta ValueError.
+    if texto is None:
+        raise ValueError('Valor monetário vazio')
+    inteiro, _, fracao = texto.partition('.')
+    if len(fracao) <= 2 and inteiro.lstrip('-').isdecimal() and (fracao.isdecimal() or not fracao):
+        return int(inteiro + fracao.ljust(2, '0'))
+    try:
+        return int(Decimal(texto.strip()).scaleb(2).quantize(Decimal(1), ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f'Valor monetário inválido: {texto!r}') from None
@@ -0,0 +1,174 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+def format_cpf_cnpj(value):
+    if value == 'N/A' or value is None:
+        return 'N/A'
+    
+    cleaned_value = ''.join(filter(str.isdigit, str(value)))
+    
+    if len(cleaned_value) == 11:
+        return f'{cleaned_value[:3]}.{cleaned_value[3:6]}.{cleaned_value[6:9]}-{cleaned_value[9:]}'
+    elif len(cleaned_value) == 14:
+        return f'{cleaned_value[:2]}.{cleaned_value[2:5]}.{cleaned_value[5:8]}/{cleaned_value[8:12]}-{cleaned_value[12:]}'
+    else:
+        return value
+
+def format_centavos(value):
+    # Valor em centavos (int) no padrão brasileiro, R$ 1.234,56, sem passar por float
+    reais, centavos = divmod(abs(int(value)), 100)
+    return f"R$ {'-' if value < 0 else ''}{reais:,}".replace(',', '.') + f',{centavos:02d}'
+
+# Versões vetorizadas das funções acima, para colunas inteiras: o resultado é
+# idêntico ao de serie.map(funcao), mas montado com operações do numpy.
+# Documentos e datas se repetem muito entre as notas, então cada valor
+# distinto é formatado uma vez (pd.factorize) e volta às linhas pelos códigos.
+
+# Máscaras dos documentos com 11 (CPF) e 14 (CNPJ) dígitos; '#' é um dígito
+MASCARAS_DOCUMENTO = {11: '###.###.###-##', 14: '##.###.###/####-##'}
+
+# Documentos mais longos que isso (nunca um CPF/CNPJ válido) vão pelo caminho escalar
+LARGURA_MAXIMA_DOCUMENTO = 32
+
+def por_valor_distinto(serie, formatar):
+    # Aplica formatar (array de valores distintos -> array de textos) uma vez
+    # por valor distinto; devolve os textos por linha e a máscara das linhas
+    # com valor ausente, que ficam para quem chamou. O código -1 (ausente)
+    # aponta para um None acrescentado no fim, mesmo sem nenhum valor distinto.
+    codigos, distintos = pd.factorize(serie)
+    formatados = np.append(formatar(np.asarray(distintos, dtype=object)), None)
+    return formatados[codigos], codigos < 0
+
+def formatar_cpf_cnpj(serie):
+    # Equivalente a serie.map(format_cpf_cnpj)
+    textos, ausentes = por_valor_distinto(serie, formatar_documentos)
+    for posicao in np.flatnonzero(ausentes):
+        textos[posicao] = format_cpf_cnpj(serie.iloc[posicao])
+    return pd.Series(textos, index=serie.index, name=serie.name, dtype=object)
+
+def formatar_documentos(valores):
+    # Só os dígitos ASCII de cada texto entram na máscara; textos com outros
+    # caracteres não ASCII, valores que não são str e textos longos seguem
+    # para format_cpf_cnpj, que usa str.isdigit
+    resultado = np.empty(len(valores), dtype=object)
+    if pd.api.types.infer_dtype(valores, skipna=False) == 'string' and max(map(len, valores), default=0) <= LARGURA_MAXIMA_DOCUMENTO:
+        vetorizaveis = np.arange(len(valores))
+    else:
+        comprimentos = np.fromiter((len(valor) if type(valor) is str else -1 for valor in valores), dtype=np.int64, count=len(valores))
+        vetorizaveis = np.flatnonzero((comprimentos >= 0) & (comprimentos <= LARGURA_MAXIMA_DOCUMENTO))
+    escalares = np.ones(len(valores), dtype=bool)
+
+    if len(vetorizaveis):
+        textos = np.array(valores[vetorizaveis].tolist(), dtype=str)
+        largura = textos.dtype.itemsize // 4
+        matriz = textos.view(np.uint32).reshape(len(textos), largura)
+        eh_digito = (matriz >= 48) & (matriz <= 57)
+        ascii = ~(matriz > 127).any(axis=1)
+        contagem = eh_digito.sum(axis=1)
+        # Textos só com dígitos (o caso comum): os dígitos são as primeiras colunas
+        so_digitos = contagem == (matriz != 0).sum(axis=1)
+
+        # Sem nenhuma das quantidades da máscara, o valor fica como está
+        mantidos = ascii & ~np.isin(contagem, list(MASCARAS_DOCUMENTO))
+        resultado[vetorizaveis[mantidos]] = valores[vetorizaveis[mantidos]]
+        escalares[vetorizaveis[mantidos]] = False
+
+        for quantidade, mascara in MASCARAS_DOCUMENTO.items():
+            linhas = np.flatnonzero(ascii & (contagem == quantidade))
+            if not len(linhas):
+                continue
+            digitos = matriz[linhas, :quantidade]
+            # Nos demais, as posições dos dígitos na ordem em que aparecem
+            com_outros = np.flatnonzero(~so_digitos[linhas])
+            if len(com_outros):
+                ordem = np.argsort(~eh_digito[linhas[com_outros]], axis=1, kind='stable')[:, :quantidade]
+                digitos[com_outros] = np.take_along_axis(matriz[linhas[com_outros]], ordem, axis=1)
+            resultado[vetorizaveis[linhas]] = preencher_modelo(mascara, digitos)
+            escalares[vetorizaveis[linhas]] = False
+
+    for posicao in np.flatnonzero(escalares):
+        resultado[posicao] = format_cpf_cnpj(valores[posicao])
+    return resultado
+
+def preencher_modelo(modelo, digitos):
+    # Um texto por linha de `digitos` (códigos dos caracteres '0'-'9'): cópia
+    # de `modelo` com cada '#' trocado pelo dígito seguinte da linha. Os
+    # trechos do modelo são copiados em blocos de colunas, não caractere a caractere.
+    saida = np.empty((len(digitos), len(modelo)), dtype=np.uint32)
+    coluna = 0
+    for trecho in re.finditer(r'#+|[^#]+', modelo):
+        inicio, fim = trecho.span()
+        if trecho.group().startswith('#'):
+            saida[:, inicio:fim] = digitos[:, coluna:coluna + fim - inicio]
+            coluna += fim - inicio
+        else:
+            saida[:, inicio:fim] = [ord(caractere) for caractere in trecho.group()]
+    return saida.view(f'U{len(modelo)}').ravel()
+
+def formatar_centavos(serie, prefixo='R$ ', milhar='.', decimal=','):
+    # Equivalente a serie.map(format_centavos) para uma coluna de centavos
+    # (int64); com prefixo='', milhar='' e decimal='.', o valor em reais como
+    # número decimal ("1234.56"), usado nas exportações
+    valores = serie.to_numpy(dtype=np.int64)
+    textos = preencher_decimais(np.abs(valores), valores < 0, prefixo, milhar, decimal)
+    return pd.Series(textos, index=serie.index, name=serie.name, dtype=object)
+
+def formatar_numero(serie):
+    # Equivalente a serie.map('{:.2f}'.format) para colunas numéricas
+    valores = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.Series(formatar_decimais(valores), index=serie.index, name=serie.name, dtype=object)
+
+def formatar_datas(serie):
+    # Datas de uma coluna datetime64 como DD/MM/AAAA e as ausentes (NaT) como
+    # N/A; como só o dia aparece no texto, as horas são descartadas antes de agrupar
+    textos, ausentes = por_valor_distinto(
+        serie.dt.normalize(), lambda datas: np.array([data.strftime('%d/%m/%Y') for data in datas], dtype=object)
+    )
+    textos[ausentes] = 'N/A'
+    return pd.Series(textos, index=serie.index, name=serie.name, dtype=object)
+
+def leiaute_decimal(quantidade_digitos, negativo, prefixo, milhar, decimal):
+    # Modelo do texto de um valor com quantidade_digitos na parte inteira; '#' é um dígito
+    inteiro = '#' * quantidade_digitos
+    grupos = []
+    while inteiro:
+        grupos.insert(0, inteiro[-3:])
+        inteiro = inteiro[:-3]
+    return prefixo + ('-' if negativo else '') + milhar.join(grupos) + decimal + '##'
+
+def formatar_decimais(valores, prefixo='', milhar='', decimal='.'):
+    # Equivalente vetorizado de prefixo + f'{valor:,.2f}' com os separadores de
+    # milhar e decimal trocados: os centavos são arredondados em inteiros e os
+    # dígitos preenchidos num modelo por quantidade de dígitos e sinal. Valores
+    # não finitos, muito grandes ou tão perto de meio centavo que valor * 100
+    # possa arredondar diferente de format() seguem pelo caminho escalar.
+    escalados = valores * 100
+    absolutos = np.abs(escalados)
+    with np.errstate(invalid='ignore'):
+        fracao = absolutos - np.floor(absolutos)
+        escalar = ~np.isfinite(escalados) | (absolutos >= 1e15) | (np.abs(fracao - 0.5) <= 8 * np.spacing(absolutos))
+    centavos = np.rint(np.where(escalar, 0, absolutos)).astype(np.int64)
+    textos = preencher_decimais(centavos, np.signbit(valores), prefixo, milhar, decimal)
+
+    for posicao in np.flatnonzero(escalar):
+        texto = f'{valores[posicao]:,.2f}'
+        textos[posicao] = prefixo + texto.replace(',', '\0').replace('.', decimal).replace('\0', milhar)
+    return textos
+
+def preencher_decimais(centavos, negativo, prefixo, milhar, decimal):
+    # Textos de valores em centavos (inteiros não negativos, com o sinal em
+    # `negativo`): os dígitos são preenchidos num modelo por quantidade de
+    # dígitos e sinal (leiaute_decimal), um grupo de linhas por modelo
+    digitos = np.searchsorted(10 ** np.arange(3, 19, dtype=np.int64), centavos, side='right') + 1
+
+    textos = np.empty(len(centavos), dtype=object)
+    classes = digitos * 2 + negativo
+    for classe in np.flatnonzero(np.bincount(classes)):
+        linhas = np.flatnonzero(classes == classe)
+        quantidade_digitos, sinal = divmod(int(classe), 2)
+        modelo = leiaute_decimal(quantidade_digitos, sinal, prefixo, milhar, decimal)
+        potencias = 10 ** np.arange(quantidade_digitos + 1, -1, -1, dtype=np.int64)
+        textos[linhas] = preencher_modelo(modelo, 48 + centavos[linhas, None] // potencias % 10)
+    return textos
@@ -0,0 +1,138 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# Índice local (SQLite) dos XMLs e das notas já processados, para que uploads
+# repetidos ou sobrepostos não contem a mesma nota duas vezes. Dentro de uma
+# mesma extração, as repetições são descartadas mesmo sem o índice (Deduplicacao).
+# Arquivos são identificados pelo digest do conteúdo (cache.calcular_digest) e
+# notas pelo par CNPJ do prestador + Número NFS-e.
+
+ESQUEMA_INDICE = """
+CREATE TABLE IF NOT EXISTS arquivos (
+    digest TEXT PRIMARY KEY,
+    processado_em TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notas (
+    cnpj_prestador TEXT NOT NULL,
+    numero TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (cnpj_prestador, numero)
+);
+"""
+
+class IndiceNotas:
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        with self._conectar() as conexao:
+            conexao.executescript(ESQUEMA_INDICE)
+
+    @contextmanager
+    def _conectar(self):
+        # Uma conexão por operação: o índice é usado por várias sessões (threads)
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            with conexao:
+                yield conexao
+        finally:
+            conexao.close()
+
+    def arquivo_conhecido(self, digest):
+        with self._conectar() as conexao:
+            return conexao.execute('SELECT 1 FROM arquivos WHERE digest = ?', (digest,)).fetchone() is not None
+
+    def notas_conhecidas(self, chaves):
+        # chaves: pares (cnpj_prestador, numero); devolve os que já estão no índice
+        with self._conectar() as conexao:
+            conexao.execute('CREATE TEMP TABLE consulta (cnpj_prestador TEXT, numero TEXT)')
+            conexao.executemany('INSERT INTO consulta VALUES (?, ?)', chaves)
+            return set(conexao.execute(
+                'SELECT c.cnpj_prestador, c.numero FROM consulta c '
+                'JOIN notas n ON n.cnpj_prestador = c.cnpj_prestador AND n.numero = c.numero'
+            ).fetchall())
+
+    def registrar(self, digests, notas):
+        # notas: trios (cnpj_prestador, numero, digest)
+        agora = datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._conectar() as conexao:
+            conexao.executemany('INSERT OR IGNORE INTO arquivos VALUES (?, ?)', [(digest, agora) for digest in digests])
+            conexao.executemany('INSERT OR IGNORE INTO notas VALUES (?, ?, ?)', notas)
+
+class Deduplicacao:
+    # Estado da deduplicação de uma extração: quais arquivos foram ignorados
+    # antes do parse e quais notas foram descartadas por já terem sido
+    # contadas. Sem índice, só as repetições dentro da própria extração (mesmo
+    # conteúdo de arquivo ou mesmo prestador e número de nota); com ele,
+    # também o que foi registrado em extrações anteriores.
+
+    def __init__(self, indice=None):
+        self.indice = indice
+        # Arquivos lidos sem erro, gravados no índice por confirmar()
+        self.arquivos_novos = []
+        # Digest do arquivo de origem de cada nota, na ordem das linhas (só com índice)
+        self.origens = []
+        self._digests_vistos = set()
+        self.arquivos_ignorados = 0
+        self.notas_novas = 0
+        self.notas_ignoradas = 0
+
+    def ignorar_arquivo(self, digest):
+        if digest in self._digests_vistos or (self.indice is not None and self.indice.arquivo_conhecido(digest)):
+            self.arquivos_ignorados += 1
+            return True
+        self._digests_vistos.add(digest)
+        return False
+
+    def registrar_origem(self, digest, quantidade, erro=None):
+        # Chamado depois do parse de cada arquivo não ignorado; um arquivo com
+        # erro não entra no índice, para ser lido de novo na próxima extração
+        if self.indice is not None:
+            self.origens.extend([digest] * quantidade)
+        if erro is None:
+            self.arquivos_novos.append(digest)
+
+    def filtrar(self, df):
+        # Remove notas repetidas dentro da própria extração e as que já estão no
+        # índice (se houver). Notas sem número ('N/A') não são deduplicadas.
+        chaves = pd.DataFrame({
+            'cnpj_prestador': df['CNPJ Prestador'].astype(str),
+            'numero': df['Número NFS-e'].astype(str)
+        })
+        com_numero = chaves['numero'] != 'N/A'
+        conhecidas = self.indice.notas_conhecidas(
+            chaves[com_numero].drop_duplicates().itertuples(index=False, name=None)
+        ) if self.indice is not None else set()
+        ja_indexadas = pd.Series(
+            pd.MultiIndex.from_frame(chaves).isin(conhecidas), index=df.index
+        ) if conhecidas else False
+        manter = ~com_numero | ~(chaves.duplicated() | ja_indexadas)
+
+        self.notas_novas += int(manter.sum())
+        self.notas_ignoradas += int((~manter).sum())
+        if self.indice is not None:
+            self.origens = [origem for origem, mantida in zip(self.origens, manter) if mantida]
+        return df[manter].reset_index(drop=True)
+
+    def confirmar(self, df):
+        # Grava no índice os arquivos lidos e as notas mantidas (df já filtrado)
+        if self.indice is None:
+            return
+        notas = [
+            (cnpj, numero, digest)
+            for cnpj, numero, digest in zip(df['CNPJ Prestador'].astype(str), df['Número NFS-e'].astype(str), self.origens)
+            if numero != 'N/A'
+        ]
+        self.indice.registrar(self.arquivos_novos, notas)
+
+    def resumo(self):
+        return {
+            'arquivos_novos': len(self.arquivos_novos),
+            'arquivos_ignorados': self.arquivos_ignorados,
+            'notas_novas': self.notas_novas,
+            'notas_ignoradas': self.notas_ignoradas,
+        }
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Métricas de uma extração: tempo, bytes lidos, notas e memória de cada etapa,
+# e o resultado de cada arquivo XML (inclusive os que falharam). Cada registro
+# também sai como uma linha JSON no logger 'nfse.metricas': etapas em INFO,
+# arquivos com erro em WARNING e os demais arquivos em DEBUG.
+#
+# Memória de cada etapa: rss_delta_mb é a variação da memória residente do
+# processo durante a etapa e rss_max_processo_mb, o maior valor dela desde o
+# início do processo (não é da etapa). Ambas incluem o que outras sessões do
+# mesmo servidor alocarem no período. Com medir_memoria, o pico_mb de cada
+# etapa e de cada arquivo vem do tracemalloc do processo que faz o trabalho
+# (os arquivos lidos no pool de processos são medidos no próprio processo).
+
+logger = logging.getLogger('nfse.metricas')
+logger.addHandler(logging.NullHandler())
+
+def registrar_evento(evento, nivel=logging.INFO, **dados):
+    if logger.isEnabledFor(nivel):
+        logger.log(nivel, json.dumps({'evento': evento, **dados}, ensure_ascii=False, default=str))
+
+def pico_rss_mb():
+    # Maior memória residente do processo desde o início dele (None onde não há `resource`)
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KiB no Linux
+    return round(pico / 1e6 if sys.platform == 'darwin' else pico * 1024 / 1e6, 1)
+
+def rss_atual_mb():
+    # Memória residente atual do processo (Linux, /proc/self/statm); None nos demais sistemas
+    try:
+        with open('/proc/self/statm') as statm:
+            paginas = int(statm.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, AttributeError, ValueError):
+        return None
+
+# O tracemalloc é do processo inteiro: o lock protege só as chamadas a ele
+# (início, leitura e reinício do pico), não o bloco medido. Cada medição em
+# andamento guarda em _medicoes o maior pico visto até o último reinício, para
+# que zerar o pico de uma (aninhada ou de outra thread) não apague o da outra.
+_lock_tracemalloc = threading.Lock()
+_medicoes = {}
+_iniciado_aqui = False
+
+@contextmanager
+def medir_pico():
+    # Mede o pico de alocações do bloco com o tracemalloc; o registro
+    # devolvido recebe 'pico_mb' no fim. Medições simultâneas (de outras
+    # threads ou aninhadas) não esperam umas pelas outras, e o pico de cada
+    # uma inclui o que o processo inteiro alocou enquanto ela rodava.
+    global _iniciado_aqui
+    medicao = object()
+    with _lock_tracemalloc:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _iniciado_aqui = True
+        pico_anterior = tracemalloc.get_traced_memory()[1]
+        for outra in _medicoes:
+            _medicoes[outra] = max(_medicoes[outra], pico_anterior)
+        tracemalloc.reset_peak()
+        _medicoes[medicao] = 0
+    registro = {}
+    try:
+        yield registro
+    finally:
+        with _lock_tracemalloc:
+            pico = tracemalloc.get_traced_memory()[1]
+            registro['pico_mb'] = round(max(_medicoes.pop(medicao), pico) / 1e6, 2)
+            for outra in _medicoes:
+                _medicoes[outra] = max(_medicoes[outra], pico)
+            if not _medicoes and _iniciado_aqui:
+                tracemalloc.stop()
+                _iniciado_aqui = False
+
+class MetricasExtracao:
+
+    def __init__(self, medir_memoria=False):
+        # Com medir_memoria, o pico de alocações de cada etapa e de cada
+        # arquivo vem do tracemalloc (mais preciso, porém mais lento)
+        self.medir_memoria = medir_memoria
+        self.etapas = {}
+        self.arquivos = []
+
+    @contextmanager
+    def etapa(self, nome, **dados):
+        # Mede o bloco; ele pode completar o registro devolvido (bytes, notas)
+        registro = dict(dados)
+        rss_inicio = rss_atual_mb()
+        inicio = time.perf_counter()
+        try:
+            with medir_pico() if self.medir_memoria else nullcontext({}) as memoria:
+                yield registro
+        finally:
+            registro['segundos'] = round(time.perf_counter() - inicio, 4)
+            registro.update(memoria)
+            rss_fim = rss_atual_mb()
+            registro['rss_delta_mb'] = round(rss_fim - rss_inicio, 1) if rss_inicio is not None and rss_fim is not None else None
+            registro['rss_max_processo_mb'] = pico_rss_mb()
+            self.etapas[nome] = registro
+            registrar_evento('etapa', etapa=nome, **registro)
+
+    def registrar_arquivo(self, arquivo, tamanho, notas, segundos, erro=None, em_cache=False, pico_mb=None):
+        # pico_mb: pico de alocações da leitura do arquivo (só com medir_memoria)
+        registro = {
+            'arquivo': arquivo,
+            'bytes': tamanho,
+            'notas': notas,
+            'segundos': round(segundos, 4),
+            'em_cache': em_cache,
+            'erro': erro,
+            'pico_mb': pico_mb,
+        }
+        self.arquivos.append(registro)
+        registrar_evento('arquivo', logging.WARNING if erro else logging.DEBUG, **registro)
+
+    @property
+    def erros(self):
+        return [registro for registro in self.arquivos if registro['erro']]
+
+    def resumo(self):
+        return {
+            'arquivos': len(self.arquivos),
+            'arquivos_com_erro': len(self.erros),
+            'arquivos_em_cache': sum(registro['em_cache'] for registro in self.arquivos),
+            'bytes': sum(registro['bytes'] for registro in self.arquivos),
+            'notas': sum(registro['notas'] for registro in self.arquivos),
+            'segundos': round(sum(registro['segundos'] for registro in self.etapas.values()), 4),
+        }
+
+    def concluir(self):
+        # Registra o resumo da extração no log e o devolve
+        resumo = self.resumo()
+        registrar_evento('extracao', **resumo)
+        return resumo
+
+    def para_dict(self):
+        return {'resumo': self.resumo(), 'etapas': self.etapas, 'arquivos': self.arquivos}
@@ -0,0 +1,152 @@
+import io
+from html import escape
+
+from extracao import COLUNAS_CENTAVOS
+from formatacao import format_centavos, format_cpf_cnpj, formatar_centavos, formatar_datas
+from resumos import TOTAIS_RESUMO, totais_por_mes
+
+# Relatório de impressão em HTML, montado em pedaços: o detalhamento sai em
+# tabelas de LINHAS_POR_PAGINA notas (uma por página impressa, com o cabeçalho
+# repetido), sem passar por uma única string com o DataFrame inteiro.
+
+LINHAS_POR_PAGINA = 500
+
+ESTILO_RELATORIO = """
+        body {
+            font-family: Arial, sans-serif;
+            margin: 20px;
+        }
+        h1 {
+            color: #1f77b4;
+            text-align: center;
+        }
+        h2 {
+            color: #333;
+            margin-top: 10px;
+        }
+        .emitente {
+            background-color: #f0f0f0;
+            padding: 15px;
+            margin-bottom: 20px;
+            border-radius: 5px;
+        }
+        .resumo {
+            display: grid;
+            grid-template-columns: repeat(4, 1fr);
+            gap: 15px;
+            margin-bottom: 30px;
+        }
+        .metric {
+            background-color: #e8f4f8;
+            padding: 15px;
+            border-radius: 5px;
+            text-align: center;
+            border-left: 4px solid #1f77b4;
+        }
+        .metric-label {
+            font-size: 12px;
+            color: #666;
+            margin-bottom: 5px;
+        }
+        .metric-value {
+            font-size: 20px;
+            font-weight: bold;
+            color: #1f77b4;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-top: 20px;
+            font-size: 10px;
+        }
+        th {
+            background-color: #1f77b4;
+            color: white;
+            padding: 8px;
+            text-align: center;
+            border: 1px solid #ddd;
+        }
+        td {
+            padding: 6px;
+            text-align: center;
+            border: 1px solid #ddd;
+        }
+        tr:nth-child(even) {
+            background-color: #f9f9f9;
+        }
+        thead {
+            display: table-header-group;
+        }
+        @media print {
+            .no-print {
+                display: none;
+            }
+            .pagina {
+                page-break-after: always;
+            }
+            .pagina:last-child {
+                page-break-after: auto;
+            }
+        }
+"""
+
+def gerar_relatorio_html(emitente, totais, df, somente_resumo=False, linhas_por_pagina=LINHAS_POR_PAGINA):
+    # Devolve os pedaços (str) do relatório de um prestador; totais é a linha
+    # do prestador em resumos.agrupar_por_prestador. No modo somente_resumo o
+    # detalhamento das notas é trocado pelos totais de cada mês de emissão.
+    yield f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Relatório NFS-e - {escape(emitente['razao_social'])}</title>
+    <style>{ESTILO_RELATORIO}    </style>
+</head>
+<body>
+    <h1>Relatório de NFS-e</h1>
+    <div class="emitente"><h2>Emitente</h2><p><strong>{escape(emitente['razao_social'])}</strong></p><p>CNPJ: {format_cpf_cnpj(emitente['cnpj'])}</p></div>
+
+    <h2>Resumo dos Valores</h2>
+    <div class="resumo">
+"""
+    for coluna, rotulo in TOTAIS_RESUMO.items():
+        yield f"""        <div class="metric">
+            <div class="metric-label">{rotulo}</div>
+            <div class="metric-value">{format_centavos(totais[coluna])}</div>
+        </div>
+"""
+    yield "    </div>\n"
+
+    if somente_resumo:
+        yield "    <h2>Totais por Mês de Emissão</h2>\n"
+        mensal = totais_por_mes(df)
+        for coluna in TOTAIS_RESUMO:
+            mensal[coluna] = formatar_centavos(mensal[coluna])
+        yield mensal.rename(columns=TOTAIS_RESUMO).to_html(index=False, classes='table')
+    else:
+        tabela = df.drop(columns=['CNPJ Prestador', 'Razão Social Prestador'], errors='ignore')
+        tabela["Data de Emissão"] = formatar_datas(tabela["Data de Emissão"])
+        for coluna in COLUNAS_CENTAVOS:
+            tabela[coluna] = formatar_centavos(tabela[coluna])
+        yield f"    <h2>Detalhamento das Notas ({len(tabela)})</h2>\n"
+        for inicio in range(0, len(tabela), linhas_por_pagina):
+            yield '<div class="pagina">'
+            yield tabela.iloc[inicio:inicio + linhas_por_pagina].to_html(index=False, classes='table')
+            yield '</div>\n'
+
+    yield """
+    <script>
+        // Abre a janela de impressão automaticamente
+        window.onload = function() {
+            window.print();
+        }
+    </script>
+</body>
+</html>
+"""
+
+def relatorio_html(emitente, totais, df, somente_resumo=False, linhas_por_pagina=LINHAS_POR_PAGINA):
+    # Relatório completo em bytes (UTF-8), codificado pedaço a pedaço
+    destino = io.BytesIO()
+    for pedaco in gerar_relatorio_html(emitente, totais, df, somente_resumo, linhas_por_pagina):
+        destino.write(pedaco.encode('utf-8'))
+    return destino.getvalue()
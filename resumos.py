@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+# Totais do quadro de resumo: coluna do DataFrame -> rótulo exibido
+TOTAIS_RESUMO = {
+    "vIBSUF": "Total IBS (UF)",
+    "vCBS": "Total CBS",
+    "Valor do Serviço": "Total de Serviços",
+    "ISS": "Total ISS",
+}
+
+def agrupar_por_prestador(df):
+    # Um único groupby pelo CNPJ do prestador devolve os totais de cada grupo
+    # (razão social, quantidade de notas e somas de TOTAIS_RESUMO, na ordem em
+    # que os prestadores aparecem) e as posições das linhas de cada grupo, para
+    # separar tabelas e planilhas sem filtrar o DataFrame uma vez por prestador.
+    grupos = df.groupby('CNPJ Prestador', observed=True, sort=False)
+    totais = grupos.agg(
+        razao_social=('Razão Social Prestador', 'first'),
+        notas=('Número NFS-e', 'size'),
+        **{coluna: (coluna, 'sum') for coluna in TOTAIS_RESUMO}
+    )
+    return totais, grupos.indices
+
+def somar_totais(totais, outros):
+    # Junta os totais de agrupar_por_prestador de dois conjuntos de notas,
+    # mantendo a ordem de aparição e a primeira razão social de cada prestador
+    juntos = pd.concat([totais, outros])
+    return juntos.groupby(level=0, sort=False).agg(
+        razao_social=('razao_social', 'first'),
+        notas=('notas', 'sum'),
+        **{coluna: (coluna, 'sum') for coluna in TOTAIS_RESUMO}
+    )
+
+def totais_por_mes(df):
+    # Quantidade de notas e somas de TOTAIS_RESUMO por mês de emissão (MM/AAAA),
+    # em ordem cronológica; notas sem data ficam em 'N/A', no fim
+    meses = df['Data de Emissão'].dt.to_period('M')
+    totais = df.groupby(meses, dropna=False, sort=True).agg(
+        Notas=('Número NFS-e', 'size'),
+        **{coluna: (coluna, 'sum') for coluna in TOTAIS_RESUMO}
+    )
+    totais.insert(0, 'Mês', [rotulo_mes(mes) for mes in totais.index])
+    return totais.reset_index(drop=True)
+
+# Dimensões dos resumos: coluna do cubo -> rótulo exibido
+DIMENSOES_RESUMO = {
+    "CPF/CNPJ Tomador": "Tomador",
+    "Código CNAE": "Código CNAE",
+    "Código NBS": "Código NBS",
+    "Item": "Item",
+    "Mês": "Competência",
+}
+
+# Alíquotas efetivas com média, mínima e máxima em cada resumo
+ALIQUOTAS_EFETIVAS = {
+    "pAliqEfetUF": "Alíquota efetiva IBS (UF)",
+    "pAliqEfetCBS": "Alíquota efetiva CBS",
+}
+
+def montar_cubo(df):
+    # Agregados de todas as combinações de DIMENSOES_RESUMO que aparecem nas
+    # notas, calculados num único groupby: quantidade de notas, somas de
+    # TOTAIS_RESUMO e, para cada alíquota efetiva, soma, quantidade, mínima e
+    # máxima das notas que a informam (maior que zero). Essas medidas se
+    # combinam entre linhas, então os resumos e filtros de resumir() saem do
+    # cubo, sem voltar ao DataFrame das notas.
+    medidas = {coluna: df[coluna] for coluna in TOTAIS_RESUMO}
+    agregacoes = {coluna: (coluna, 'sum') for coluna in TOTAIS_RESUMO}
+    for coluna in ALIQUOTAS_EFETIVAS:
+        informada = df[coluna].where(df[coluna] > 0)
+        medidas[coluna] = informada
+        agregacoes.update({
+            f'{coluna}_soma': (coluna, 'sum'),
+            f'{coluna}_notas': (coluna, 'count'),
+            f'{coluna}_min': (coluna, 'min'),
+            f'{coluna}_max': (coluna, 'max'),
+        })
+
+    dados = pd.DataFrame({
+        **{coluna: df[coluna] for coluna in DIMENSOES_RESUMO if coluna != 'Mês'},
+        'Mês': df['Data de Emissão'].dt.to_period('M'),
+        'Razão Social Tomador': df['Razão Social Tomador'],
+        **medidas,
+    })
+    cubo = dados.groupby(list(DIMENSOES_RESUMO), observed=True, dropna=False, sort=False).agg(
+        Notas=('Mês', 'size'),
+        razao_social_tomador=('Razão Social Tomador', 'first'),
+        **agregacoes
+    )
+    return cubo.reset_index()
+
+def resumir(cubo, dimensao, filtros=None):
+    # Resumo por uma coluna de DIMENSOES_RESUMO a partir do cubo de
+    # montar_cubo, apenas com as linhas cujas dimensões estão nos valores de
+    # filtros ({coluna: valores}). Competências em ordem cronológica ('N/A' no
+    # fim); as demais dimensões pelo total de serviços, do maior para o menor.
+    if filtros:
+        selecionadas = np.ones(len(cubo), dtype=bool)
+        for coluna, valores in filtros.items():
+            if valores:
+                selecionadas &= cubo[coluna].isin(valores).to_numpy()
+        cubo = cubo[selecionadas]
+
+    agregacoes = {'Notas': ('Notas', 'sum'), **{coluna: (coluna, 'sum') for coluna in TOTAIS_RESUMO}}
+    if dimensao == "CPF/CNPJ Tomador":
+        agregacoes['Razão Social Tomador'] = ('razao_social_tomador', 'first')
+    for coluna in ALIQUOTAS_EFETIVAS:
+        agregacoes.update({
+            f'{coluna}_soma': (f'{coluna}_soma', 'sum'),
+            f'{coluna}_notas': (f'{coluna}_notas', 'sum'),
+            f'{coluna}_min': (f'{coluna}_min', 'min'),
+            f'{coluna}_max': (f'{coluna}_max', 'max'),
+        })
+    resumo = cubo.groupby(dimensao, observed=True, dropna=False, sort=dimensao == 'Mês').agg(**agregacoes)
+    if dimensao != 'Mês':
+        resumo = resumo.sort_values('Valor do Serviço', ascending=False, kind='stable')
+
+    for coluna, rotulo in ALIQUOTAS_EFETIVAS.items():
+        notas = resumo.pop(f'{coluna}_notas')
+        resumo[f'{rotulo} média'] = resumo.pop(f'{coluna}_soma') / notas.where(notas > 0)
+        resumo[f'{rotulo} mínima'] = resumo.pop(f'{coluna}_min')
+        resumo[f'{rotulo} máxima'] = resumo.pop(f'{coluna}_max')
+    resumo = resumo.reset_index()
+    if dimensao == "CPF/CNPJ Tomador":
+        resumo.insert(1, 'Razão Social Tomador', resumo.pop('Razão Social Tomador'))
+    return resumo
+
+def valores_dimensao(cubo, dimensao):
+    # Valores distintos de uma dimensão no cubo, para os filtros: competências
+    # em ordem cronológica e os demais em ordem alfabética
+    valores = cubo[dimensao].drop_duplicates()
+    if isinstance(valores.dtype, pd.CategoricalDtype):
+        valores = valores.astype(object)
+    return valores.sort_values(na_position='last').tolist()
+
+def rotulo_mes(mes):
+    return mes.strftime('%m/%Y') if not pd.isna(mes) else 'N/A'
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from exportacao import FORMATO_MOEDA, FORMATO_NUMERO, cols_numeric, cols_to_format_currency
+from formatacao import formatar_centavos, formatar_cpf_cnpj, formatar_datas, formatar_numero
+from resumos import DIMENSOES_RESUMO, TOTAIS_RESUMO, rotulo_mes
+
+# Paginação da tabela de notas no servidor: busca e ordenação trabalham nas
+# colunas tipadas (números, datas, códigos de categoria) e devolvem apenas as
+# posições das linhas; só a página exibida é formatada para a tela.
+
+# Colunas de texto consideradas pela busca
+COLUNAS_BUSCA = [
+    "CPF/CNPJ Tomador", "Razão Social Tomador", "Número NFS-e",
+    "Item", "Código NBS", "Código CNAE", "Descrição do Serviço",
+]
+
+def chave_ordenacao(serie):
+    # Valores usados para ordenar a coluna: categorias pela ordem alfabética
+    # (os códigos seguem a ordem de aparição) e o número da NFS-e como número
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories.astype(str)
+        posicao = np.empty(len(categorias), dtype=np.int64)
+        posicao[np.argsort(categorias.to_numpy(), kind='stable')] = np.arange(len(categorias))
+        codigos = serie.cat.codes.to_numpy()
+        return pd.Series(np.where(codigos >= 0, posicao[codigos], -1))
+    if serie.name == "Número NFS-e":
+        return pd.to_numeric(serie, errors='coerce').reset_index(drop=True)
+    return serie.reset_index(drop=True)
+
+def contem(serie, busca):
+    # Máscara das linhas cujo texto contém `busca`; numa coluna categórica a
+    # busca é feita só nas categorias e levada às linhas pelos códigos
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories.astype(str).str.contains(busca, case=False, regex=False)
+        return np.isin(serie.cat.codes.to_numpy(), np.flatnonzero(categorias))
+    return serie.astype(str).str.contains(busca, case=False, regex=False).to_numpy()
+
+def posicoes_tabela(df, busca='', ordenar_por=None, crescente=True):
+    # Posições (iloc) das linhas que contêm `busca` em alguma das COLUNAS_BUSCA,
+    # na ordem pedida; sem busca nem ordenação, todas as linhas na ordem original
+    posicoes = np.arange(len(df))
+
+    if busca:
+        encontradas = np.zeros(len(df), dtype=bool)
+        for coluna in COLUNAS_BUSCA:
+            if coluna in df.columns:
+                encontradas |= contem(df[coluna], busca)
+        posicoes = posicoes[encontradas]
+
+    if ordenar_por:
+        chaves = chave_ordenacao(df[ordenar_por]).iloc[posicoes].reset_index(drop=True)
+        ordem = chaves.sort_values(ascending=crescente, kind='stable', na_position='last').index.to_numpy()
+        posicoes = posicoes[ordem]
+
+    return posicoes
+
+def formatar_pagina(df):
+    # Textos exibidos da página: moeda (a partir dos centavos), números com
+    # duas casas e datas, com os formatadores vetorizados de formatacao (uma
+    # passada por coluna)
+    pagina = df.copy()
+    for coluna in pagina.columns:
+        if coluna in cols_to_format_currency:
+            pagina[coluna] = formatar_centavos(pagina[coluna])
+        elif coluna in cols_numeric:
+            pagina[coluna] = formatar_numero(pagina[coluna])
+        elif coluna == "Data de Emissão":
+            pagina[coluna] = formatar_datas(pagina[coluna])
+    return pagina
+
+def tabela_resumo(resumo):
+    # Resumo de resumos.resumir com os rótulos de DIMENSOES_RESUMO e
+    # TOTAIS_RESUMO, documento do tomador formatado e competência em MM/AAAA;
+    # totais continuam em centavos e alíquotas numéricas (usada também na planilha)
+    tabela = resumo.copy()
+    if "CPF/CNPJ Tomador" in tabela.columns:
+        tabela["CPF/CNPJ Tomador"] = formatar_cpf_cnpj(tabela["CPF/CNPJ Tomador"])
+    if "Mês" in tabela.columns:
+        tabela["Mês"] = [rotulo_mes(mes) for mes in tabela["Mês"]]
+    return tabela.rename(columns={**DIMENSOES_RESUMO, **TOTAIS_RESUMO})
+
+def formatos_resumo(tabela):
+    # Formatos da planilha de um resumo: moeda nos totais e duas casas nas alíquotas
+    return {
+        coluna: FORMATO_MOEDA if coluna in TOTAIS_RESUMO.values() else FORMATO_NUMERO
+        for coluna in tabela.columns[tabela.columns.get_loc('Notas') + 1:]
+    }
+
+def formatar_resumo(tabela):
+    # Textos exibidos de tabela_resumo; alíquota sem nenhuma nota que a informe fica '-'
+    exibida = tabela.copy()
+    for coluna, formato in formatos_resumo(tabela).items():
+        textos = formatar_centavos(exibida[coluna]) if formato == FORMATO_MOEDA else formatar_numero(exibida[coluna])
+        exibida[coluna] = textos.where(exibida[coluna].notna(), '-')
+    return exibida
@@ -0,0 +1,130 @@
+import io
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from extracao import ColetorNotas, ExtracaoCancelada, extrair_dados_uploads
+from metricas import MetricasExtracao, registrar_evento
+from resumos import agrupar_por_prestador, somar_totais
+
+# Extração dos uploads numa thread, para o app acompanhar o andamento sem
+# ficar bloqueado: arquivos XML concluídos, notas por segundo, totais parciais
+# por prestador e as últimas notas lidas, com a opção de cancelar. Os
+# resultados parciais são montados só com as notas novas desde a última
+# atualização e não passam pela deduplicação (notas repetidas e índice local).
+
+# Intervalo mínimo, em segundos, entre duas atualizações dos resultados parciais
+INTERVALO_PARCIAL = 0.5
+
+# Últimas notas lidas mantidas para exibição durante a extração
+LINHAS_PARCIAIS = 100
+
+def copiar_upload(arquivo):
+    # Cópia em memória com o mesmo nome, para que a thread não divida a
+    # posição de leitura do arquivo com o app
+    copia = io.BytesIO(arquivo.getvalue())
+    copia.name = arquivo.name
+    return copia
+
+class TarefaExtracao:
+
+    def __init__(self, arquivos, workers=1, cache=None, indice=None, medir_memoria=False, backend=None, pool=None):
+        # arquivos: objetos com .name e .getvalue() (os uploads do Streamlit)
+        self.arquivos = [copiar_upload(arquivo) for arquivo in arquivos]
+        self.workers = workers
+        self.cache = cache
+        self.indice = indice
+        self.backend = backend
+        self.pool = pool
+        self.metricas = MetricasExtracao(medir_memoria=medir_memoria)
+        # 'executando', 'concluida', 'cancelada' ou 'erro'
+        self.status = 'executando'
+        self.resultado = None  # (df, emitente, metricas) quando concluída
+        self.erro = None
+        self.inicio = None
+        self.fim = None
+        self._cancelar = threading.Event()
+        self._lock = threading.Lock()
+        self._concluidos = 0
+        self._total = None
+        self._notas = 0
+        self._totais = None
+        self._linhas = None
+        self._pendentes = ColetorNotas()
+        self._proxima_parcial = 0.0
+        self._thread = threading.Thread(target=self._executar, name='extracao-nfse', daemon=True)
+
+    def iniciar(self):
+        self.inicio = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def cancelar(self):
+        # A extração para assim que o XML em andamento for concluído
+        self._cancelar.set()
+
+    def andamento(self):
+        # Retrato do andamento para exibição: total é None até os arquivos
+        # serem abertos; totais e linhas são os resultados parciais (ou None)
+        with self._lock:
+            segundos = (self.fim or time.perf_counter()) - self.inicio
+            return {
+                'status': self.status,
+                'cancelando': self._cancelar.is_set() and self.status == 'executando',
+                'concluidos': self._concluidos,
+                'total': self._total,
+                'notas': self._notas,
+                'segundos': segundos,
+                'notas_por_segundo': self._notas / segundos if segundos > 0 else 0.0,
+                'totais': self._totais,
+                'linhas': self._linhas,
+            }
+
+    def _executar(self):
+        try:
+            df, emitente = extrair_dados_uploads(
+                self.arquivos, self.workers, cache=self.cache, indice=self.indice, metricas=self.metricas,
+                backend=self.backend, progresso=self._progresso, cancelar=self._cancelar, pool=self.pool
+            )
+        except ExtracaoCancelada:
+            self._atualizar_parciais()
+            status = 'cancelada'
+        except Exception as erro:
+            self.erro = erro
+            status = 'erro'
+            registrar_evento('extracao_erro', logging.ERROR, erro=repr(erro))
+        else:
+            self.resultado = (df, emitente, self.metricas)
+            status = 'concluida'
+        self.arquivos = []
+        with self._lock:
+            self.fim = time.perf_counter()
+            self.status = status
+        if status == 'cancelada':
+            registrar_evento('extracao_cancelada', concluidos=self._concluidos, total=self._total, notas=self._notas)
+
+    def _progresso(self, concluidos, total, notas):
+        # Chamado na thread da extração a cada XML concluído
+        with self._lock:
+            self._concluidos = concluidos
+            self._total = total
+            self._notas += len(notas)
+        self._pendentes.estender(notas)
+        if time.perf_counter() >= self._proxima_parcial:
+            self._atualizar_parciais()
+
+    def _atualizar_parciais(self):
+        # Soma aos totais parciais as notas pendentes e guarda as últimas linhas
+        novas = self._pendentes.para_dataframe()
+        self._pendentes = ColetorNotas()
+        self._proxima_parcial = time.perf_counter() + INTERVALO_PARCIAL
+        if novas.empty:
+            return
+        totais, _ = agrupar_por_prestador(novas)
+        with self._lock:
+            if self._totais is not None:
+                totais = somar_totais(self._totais, totais)
+            self._totais = totais
+            self._linhas = pd.concat([self._linhas, novas.tail(LINHAS_PARCIAIS)], ignore_index=True).tail(LINHAS_PARCIAIS)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Os testes importam os módulos da raiz do repositório e o gerador de corpus
+# dos benchmarks (benchmarks/corpus.py)
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
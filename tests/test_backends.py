@@ -0,0 +1,60 @@
+# O ElementTree e o lxml (extracao.BACKENDS) devem gerar exatamente o mesmo
+# DataFrame e o mesmo emitente em cada corpus: lotes e notas avulsas ABRASF,
+# com e sem namespace, leiaute nacional, XMLs inválidos, comentários dentro do
+# texto de um campo e notas dentro de notas.
+import io
+import re
+
+import pytest
+
+from corpus import gerar_arquivos, gerar_lote
+from extracao import NAMESPACE_ABRASF, ColetorNotas, ler_xml, lxml_etree
+
+pytestmark = pytest.mark.skipif(lxml_etree is None, reason='lxml não está instalado')
+
+def nota_aninhada():
+    # Lote de uma nota com outra InfNfse dentro da declaração, depois do
+    # Numero e do prestador da nota externa
+    externa = gerar_lote(1)
+    interna = re.search(r'<InfNfse .*</InfNfse>', gerar_lote(1, inicio=99), re.DOTALL).group()
+    return externa.replace('</InfDeclaracaoPrestacaoServico>', interna + '</InfDeclaracaoPrestacaoServico>', 1)
+
+LOTE = gerar_lote(200, prestadores=3, meses=4, proporcao_cpf=0.2)
+
+CASOS = {
+    'lote abrasf': [LOTE],
+    'lote sem namespace': [LOTE.replace(f' xmlns="{NAMESPACE_ABRASF}"', '')],
+    'notas avulsas abrasf': [conteudo for _, conteudo in gerar_arquivos(50, 1)],
+    'nacional': [conteudo for _, conteudo in gerar_arquivos(50, 1, leiaute='nacional')],
+    'misto': [conteudo for _, conteudo in gerar_arquivos(300, 50, leiaute='misto')],
+    'xml truncado': [LOTE[:len(LOTE) // 2]],
+    'xml sem notas': ['<ConsultarNfseResposta/>'],
+    'infnfse na raiz': [f'<InfNfse xmlns="{NAMESPACE_ABRASF}"><Numero>1</Numero></InfNfse>'],
+    'comentário no texto': [gerar_lote(3).replace('<Numero>1</Numero>', '<Numero>1<!-- corrigido -->0<?revisao?></Numero>', 1)],
+    'nota aninhada': [nota_aninhada()],
+}
+
+def ler(conteudos, backend):
+    coletor = ColetorNotas()
+    emitentes = [ler_xml(io.BytesIO(conteudo.encode('utf-8')), coletor, backend) for conteudo in conteudos]
+    return coletor.para_dataframe(), emitentes
+
+@pytest.mark.parametrize('nome', CASOS)
+def test_paridade(nome):
+    df_etree, emitentes_etree = ler(CASOS[nome], 'etree')
+    df_lxml, emitentes_lxml = ler(CASOS[nome], 'lxml')
+    assert df_etree.equals(df_lxml)
+    assert emitentes_etree == emitentes_lxml
+
+@pytest.mark.parametrize('backend', ['etree', 'lxml'])
+def test_comentario_no_texto(backend):
+    df, _ = ler(CASOS['comentário no texto'], backend)
+    assert df['Número NFS-e'].tolist() == ['10', '2', '3']
+
+@pytest.mark.parametrize('backend', ['etree', 'lxml'])
+def test_nota_aninhada(backend):
+    # A nota interna sai primeiro (fecha antes) e a externa mantém seus campos
+    df, emitentes = ler(CASOS['nota aninhada'], backend)
+    assert df['Número NFS-e'].tolist() == ['99', '1']
+    assert df['Valor do Serviço'].iloc[1] == 10100
+    assert df['CNPJ Prestador'].tolist() == ['11222333000181', '11222333000181']
@@ -0,0 +1,56 @@
+# Planilhas de exportacao.gerar_excel com colunas sem nenhum valor: as
+# alíquotas de um resumo em que nenhuma nota as informa (só NaN) e uma coluna
+# de datas toda ausente.
+import io
+import xml.etree.ElementTree as ET
+import zipfile
+
+import pandas as pd
+
+from corpus import gerar_lote
+from exportacao import FORMATO_DATA, NS_PLANILHA, gerar_excel, letra_coluna
+from extracao import ColetorNotas, ler_xml
+from resumos import ALIQUOTAS_EFETIVAS, TOTAIS_RESUMO, montar_cubo, resumir
+from tabela import formatos_resumo, tabela_resumo
+
+NS = {'s': NS_PLANILHA}
+
+def ler_planilha(conteudo):
+    # Larguras das colunas e linhas (textos das células, '' nas que não foram gravadas)
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+        planilha = ET.fromstring(pacote.read('xl/worksheets/sheet1.xml'))
+    larguras = [float(col.get('width')) for col in planilha.iterfind('s:cols/s:col', NS)]
+    letras = [letra_coluna(indice) for indice in range(len(larguras))]
+    linhas = []
+    for linha in planilha.iterfind('s:sheetData/s:row', NS):
+        celulas = {celula.get('r').rstrip('0123456789'): ''.join(celula.itertext()) for celula in linha.iterfind('s:c', NS)}
+        linhas.append([celulas.get(letra, '') for letra in letras])
+    return larguras, linhas
+
+def notas_sem_aliquotas(quantidade):
+    coletor = ColetorNotas()
+    ler_xml(io.BytesIO(gerar_lote(quantidade, meses=2).encode('utf-8')), coletor)
+    df = coletor.para_dataframe()
+    for coluna in ALIQUOTAS_EFETIVAS:
+        df[coluna] = 0.0
+    return df
+
+def test_resumo_sem_aliquotas():
+    tabela = tabela_resumo(resumir(montar_cubo(notas_sem_aliquotas(20)), 'Mês'))
+    colunas_aliquotas = [coluna for coluna in tabela.columns if coluna.startswith(tuple(ALIQUOTAS_EFETIVAS.values()))]
+    assert len(colunas_aliquotas) == 6
+    assert tabela[colunas_aliquotas].isna().all().all()
+
+    larguras, linhas = ler_planilha(gerar_excel(tabela, formatos_resumo(tabela), list(TOTAIS_RESUMO.values())))
+    assert linhas[0] == list(tabela.columns)
+    assert len(linhas) == len(tabela) + 1
+    for coluna in colunas_aliquotas:
+        indice = tabela.columns.get_loc(coluna)
+        assert larguras[indice] == len(coluna) + 2
+        assert all(linha[indice] == '' for linha in linhas[1:])
+
+def test_datas_ausentes():
+    df = pd.DataFrame({'Número': ['1', '2'], 'Data de Emissão': pd.to_datetime([None, None])})
+    larguras, linhas = ler_planilha(gerar_excel(df, {'Data de Emissão': FORMATO_DATA}))
+    assert larguras[1] == len('Data de Emissão') + 2
+    assert linhas[1:] == [['1', ''], ['2', '']]